@@ -0,0 +1,101 @@
+"""
+Binary quad bytecode (.qbc), loaded by tools/qx.py without any text parsing.
+
+Layout (little endian):
+    header      HEADER: magic, version, number of symbols, constants and instructions
+    symbols     for every symbol: u16 length + utf-8 name
+    constants   for every constant: u8 tag + CONST_INT: i64 / CONST_FLOAT: f64 /
+                CONST_BIGINT: u32 length + ascii decimal digits
+    code        for every instruction: INSN record - opcode, 3 operand tags, 3 operand values
+
+An operand value is an index in the symbols for TAG_SYMBOL, an index in the constants for
+TAG_CONST, and an instruction number (as in the .qud text) for TAG_LINE.
+The opcode numbers are the indices in OPCODES.
+This module is the only definition of the format: tools/qx.py reads it, and tools/qbc.py writes it with write_insns.
+"""
+import struct
+
+from .quad import MAX_OPERANDS, OPERAND_ID, OPERAND_TEMP, OPERAND_NUMBER, OPERAND_LABEL
+
+MAGIC = b'QUDB'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBIII')
+INSN = struct.Struct('<BBBBiii')
+SYMBOL_LEN = struct.Struct('<H')
+CONST_TAG = struct.Struct('<B')
+INT64 = struct.Struct('<q')
+FLOAT64 = struct.Struct('<d')
+BIGINT_LEN = struct.Struct('<I')
+
+#operand tags
+TAG_NONE = 0
+TAG_SYMBOL = 1
+TAG_CONST = 2
+TAG_LINE = 3
+
+#constant tags
+CONST_INT = 0
+CONST_FLOAT = 1
+CONST_BIGINT = 2
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+def pack_const(value):
+    if type(value) is float:
+        return CONST_TAG.pack(CONST_FLOAT) + FLOAT64.pack(value)
+    if INT64_MIN <= value <= INT64_MAX:
+        return CONST_TAG.pack(CONST_INT) + INT64.pack(value)
+    digits = str(value).encode('ascii')
+    return CONST_TAG.pack(CONST_BIGINT) + BIGINT_LEN.pack(len(digits)) + digits
+
+def write_bytecode(code, fp):
+    """
+    Write the QuadCode code to the binary file object fp
+    """
+    insns = []
+    for insn_idx in range(len(code)):
+        operands = []
+        for kind, value in code.operands(insn_idx):
+            if kind == OPERAND_ID or kind == OPERAND_TEMP:
+                operands.append((TAG_SYMBOL, code.format_operand(kind, value)))
+            elif kind == OPERAND_NUMBER:
+                operands.append((TAG_CONST, code.consts[value]))
+            elif kind == OPERAND_LABEL:
+                operands.append((TAG_LINE, code.labels[value] + 1))
+        insns.append((code.ops[insn_idx], operands))
+    write_insns(insns, fp)
+
+def write_insns(insns, fp):
+    """
+    Write a program to the binary file object fp
+    @param insns: a list of (opcode number, operands) for every instruction, where an operand is
+    (TAG_SYMBOL, name), (TAG_CONST, number) or (TAG_LINE, instruction number)
+    """
+    #name -> index
+    symbols = {}
+    #(type, repr) -> (index, number), the type since 1 == 1.0, and the repr since 0.0 == -0.0
+    consts = {}
+    records = bytearray(INSN.size * len(insns))
+    for insn_idx, (op, operands) in enumerate(insns):
+        tags = [TAG_NONE] * MAX_OPERANDS
+        values = [0] * MAX_OPERANDS
+        for operand_idx, (tag, value) in enumerate(operands):
+            tags[operand_idx] = tag
+            if tag == TAG_SYMBOL:
+                values[operand_idx] = symbols.setdefault(value, len(symbols))
+            elif tag == TAG_CONST:
+                values[operand_idx] = consts.setdefault((type(value), repr(value)), (len(consts), value))[0]
+            else:
+                values[operand_idx] = value
+        INSN.pack_into(records, insn_idx * INSN.size, op, *(tags + values))
+
+    fp.write(HEADER.pack(MAGIC, VERSION, len(symbols), len(consts), len(insns)))
+    for name in sorted(symbols, key=symbols.get):
+        encoded_name = name.encode('utf-8')
+        fp.write(SYMBOL_LEN.pack(len(encoded_name)))
+        fp.write(encoded_name)
+    for _, value in sorted(consts.values(), key=lambda const: const[0]):
+        fp.write(pack_const(value))
+    fp.write(records)
@@ -0,0 +1,166 @@
+from .quad import JUMP, JMPZ, HALT
+
+class BasicBlock:
+    def __init__(self, index, start, end):
+        self.index = index
+        #the instructions of the block are start .. end - 1
+        self.start = start
+        self.end = end
+        self.succs = []
+        self.preds = []
+
+    def __repr__(self):
+        return 'BasicBlock({}, {}..{})'.format(self.index, self.start, self.end - 1)
+
+class CFG:
+    """
+    The control flow graph of a QuadCode: its basic blocks and the jumps between them.
+    blocks[0] is the entry block
+    """
+    def __init__(self, code):
+        self.code = code
+        leaders = code.block_leaders() if len(code) else []
+        ends = leaders[1:] + [len(code)]
+        self.blocks = [BasicBlock(index, start, end) for index, (start, end) in enumerate(zip(leaders, ends))]
+        #first instruction index -> block
+        self.block_at = {block.start: block for block in self.blocks}
+        for block in self.blocks:
+            for succ_start in self.successors(block.end - 1):
+                succ = self.block_at[succ_start]
+                if succ not in block.succs:
+                    block.succs.append(succ)
+                    succ.preds.append(block)
+
+    def successors(self, insn_idx):
+        """
+        The indices of the instructions that can run after insn_idx
+        """
+        op = self.code.ops[insn_idx]
+        if op == HALT:
+            return []
+        next_insns = []
+        if op == JUMP or op == JMPZ:
+            next_insns.append(self.code.labels[self.code.operand(insn_idx, 0)[1]])
+        if op != JUMP and insn_idx + 1 < len(self.code):
+            next_insns.append(insn_idx + 1)
+        return next_insns
+
+def reverse_postorder(cfg):
+    """
+    The blocks that are reachable from the entry block, in reverse postorder
+    """
+    order = []
+    visited = set()
+    if not cfg.blocks:
+        return order
+    #(block, index of the next successor to visit)
+    stack = [(cfg.blocks[0], 0)]
+    visited.add(cfg.blocks[0].index)
+    while stack:
+        block, succ_idx = stack.pop()
+        if succ_idx < len(block.succs):
+            stack.append((block, succ_idx + 1))
+            succ = block.succs[succ_idx]
+            if succ.index not in visited:
+                visited.add(succ.index)
+                stack.append((succ, 0))
+        else:
+            order.append(block)
+    order.reverse()
+    return order
+
+def immediate_dominators(cfg):
+    """
+    The dominator tree, with the algorithm of Cooper, Harvey and Kennedy
+    @returns a list with the index of the immediate dominator of every block,
+    None for the entry block and the unreachable blocks
+    """
+    order = reverse_postorder(cfg)
+    rpo_index = {block.index: i for i, block in enumerate(order)}
+    idom = [None] * len(cfg.blocks)
+    if not order:
+        return idom
+    idom[0] = 0
+
+    def intersect(a, b):
+        while a != b:
+            while rpo_index[a] > rpo_index[b]:
+                a = idom[a]
+            while rpo_index[b] > rpo_index[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new_idom = None
+            for pred in block.preds:
+                if idom[pred.index] is None:
+                    continue
+                new_idom = pred.index if new_idom is None else intersect(pred.index, new_idom)
+            if idom[block.index] != new_idom:
+                idom[block.index] = new_idom
+                changed = True
+    idom[0] = None
+    return idom
+
+class DominatorTree:
+    """
+    The dominator tree of the idom list of immediate_dominators, numbered in depth first order,
+    so a block dominates another if the numbers of the other are within its own
+    """
+    def __init__(self, idom):
+        self.idom = idom
+        children = [[] for _ in idom]
+        for index, parent in enumerate(idom):
+            if parent is not None:
+                children[parent].append(index)
+        #block index -> the depth first number of entering and of leaving it, None for unreachable blocks
+        self.enter = [None] * len(idom)
+        self.leave = [None] * len(idom)
+        if not idom:
+            return
+        counter = 0
+        stack = [(0, False)]
+        while stack:
+            index, leaving = stack.pop()
+            counter += 1
+            if leaving:
+                self.leave[index] = counter
+                continue
+            self.enter[index] = counter
+            stack.append((index, True))
+            stack.extend((child, False) for child in children[index])
+
+    def dominates(self, a, b):
+        """
+        Checks if block index a dominates block index b
+        """
+        if self.enter[a] is None or self.enter[b] is None:
+            return False
+        return self.enter[a] <= self.enter[b] and self.leave[b] <= self.leave[a]
+
+def natural_loops(cfg, idom):
+    """
+    Find the loops of cfg: a jump from a block back to a block that dominates it closes a loop.
+    Loops with the same header are merged
+    @returns a list of (header block index, set of the loop block indices), the inner loops first
+    """
+    reachable = {block.index for block in cfg.blocks if block.index == 0 or idom[block.index] is not None}
+    tree = DominatorTree(idom)
+    loops = {}
+    for block in cfg.blocks:
+        for succ in block.succs:
+            if block.index not in reachable or not tree.dominates(succ.index, block.index):
+                continue
+            body = loops.setdefault(succ.index, {succ.index})
+            #the loop is the header and every block that reaches the back edge without passing the header
+            stack = [block]
+            while stack:
+                loop_block = stack.pop()
+                if loop_block.index in body:
+                    continue
+                body.add(loop_block.index)
+                stack.extend(pred for pred in loop_block.preds if pred.index in reachable)
+    return sorted(loops.items(), key=lambda loop: len(loop[1]))
@@ -1,43 +1,50 @@
 import sys
 from .expr import *
+from .quad import QuadCode, OPCODE_IDS, OPERAND_TEMP, OPERAND_LABEL
 
 class Codegen:
     def __init__(self):
-        self.code = []
+        self.code = QuadCode()
         self.labels = []
-        self.labels_mapping = {}
         self.temps = []
         self.temps_type = {}
 
     def get_code(self):
-        return '\n'.join(['{}: {}'.format(l + 1, self.code[l]) for l in range(len(self.code))])
-
-    def backpatching(self):
-        for line_idx in range(len(self.code)):
-            for label_name, label_lineno in self.labels_mapping.items():
-                if label_name in self.code[line_idx]:
-                    self.code[line_idx] = self.code[line_idx].replace(label_name, str(label_lineno))
+        return '\n'.join(['{}: {}'.format(l + 1, line) for l, line in enumerate(self.get_lines())])
+
+    def get_lines(self):
+        return self.code.lines()
+
+    def operand(self, arg):
+        arg_type = type(arg)
+        if arg_type is ID:
+            return self.code.id_operand(arg.name)
+        elif arg_type is Temp:
+            return (OPERAND_TEMP, arg.index)
+        elif arg_type is Number:
+            return self.code.number_operand(arg.value)
+        elif arg_type is Label:
+            return (OPERAND_LABEL, arg.index)
+        raise TypeError('cannot use `{}` as an instruction operand'.format(arg))
 
     def add_insn(self, insn, *args):
-        insn_text = '{} {}'.format(insn, ' '.join(str(arg.get_value()) for arg in args)) 
-        self.code.append(insn_text)
+        self.code.append(OPCODE_IDS[insn], [self.operand(arg) for arg in args])
 
     def get_insn_type(self, insn):
         insn_type = 'int' if insn[0] == 'I' else 'float'
         return insn_type
     
     def newlabel(self):
-        label = 'l{}'.format(len(self.labels))
+        label = Label(self.code.new_label())
         self.labels.append(label)
         return label
 
-    def label(self, label_name):
-        #the next instruction will be labeled with label_name
-        self.labels_mapping[label_name] = len(self.code) + 1
+    def label(self, label):
+        #the next instruction will be labeled with label
+        self.code.place_label(label.index)
 
     def newtemp(self, var_type):
-        temp_name = 't{}'.format(len(self.temps))
-        temp = Temp(temp_name, var_type=var_type)
+        temp = Temp(self.code.new_temp(var_type), var_type=var_type)
         self.temps.append(temp)
         self.temps_type[temp] = var_type
         return temp
@@ -135,13 +142,13 @@ class Codegen:
 
     def JUMP(self, l):
         'jump to instruction number l'
-        self.add_insn('JUMP', Label(l))
+        self.add_insn('JUMP', l)
 
     def JMPZ(self, l, a):
         'if a=0 then jump to instruction number l else continue'
         insn = 'JMPZ'
         self.check_args_types(insn, {a: 'int'})
-        self.add_insn(insn, Label(l), a)
+        self.add_insn(insn, l, a)
 
     def HALT(self):
         'stop immediately'
@@ -7,8 +7,14 @@ from .tokenizer import tokens, lexer
 from . import syntax_parser
 from .symbol_table import SymbolTable, AlreadyExists, Symbol
 from .codegen import Codegen
+from . import bytecode
+from . import constant_folding
+from .pass_manager import PassManager, OPT_LEVELS
 from .expr import *
 
+#up to this many switch cases are compared one by one instead of with a binary search
+SWITCH_LINEAR_CASES = 3
+
 class UnexpectedSymbol(CompilerError):
     pass
 
@@ -19,8 +25,19 @@ class UsedBeforeAssignedError(CompilerError):
     pass
 
 class Compiler:
-    def __init__(self, program):
+    def __init__(self, program, optimize=True, invert_loops=False, pass_manager=None):
+        """
+        @param optimize: fold constants while generating the code, and run the passes of -O2
+        if there is no pass_manager
+        @param pass_manager: the PassManager that runs the optimization passes on the generated code
+        """
         self.code_text = program
+        self.optimize = optimize
+        #emit while loops as a guarded do-while
+        self.invert_loops = invert_loops
+        if pass_manager is None:
+            pass_manager = PassManager(OPT_LEVELS[2] if optimize else OPT_LEVELS[0])
+        self.pass_manager = pass_manager
         self.ast = None
         self.symbol_table = SymbolTable()
         self.codegen = Codegen()
@@ -38,23 +55,55 @@ class Compiler:
         if symbol not in symbols_names:
             raise UnexpectedSymbol('exptected symbol to be one of `{}`, got: `{}`'.format(symbols_names, symbol))
 
+    def fold_constant(self, insn, values, val_type):
+        """
+        Computes insn at compile time if all its values are Numbers
+        @returns the result as a Number, or None if the instruction has to be emitted
+        """
+        if not self.optimize or any(type(value) is not Number for value in values):
+            return None
+        result = constant_folding.fold(insn, [value.value for value in values])
+        if result is None:
+            return None
+        return Number(result, val_type)
+
     def type_max(self, *types):
         if 'float' in types:
             return 'float'
         return 'int'
 
-    def run(self):
+    def compile(self):
+        """
+        Parse the program and generate its quad code
+        @returns True if the program was compiled without errors
+        """
         self.ast = syntax_parser.parser.parse(self.code_text, debug=False)
         if syntax_parser.tokenizer.has_tokenizing_error or syntax_parser.has_syntax_error:
             self.has_errors = True
         self.create_temp_vars()
         self.handle_program(self.ast)
         if not self.has_errors:
-            #replace labels names with labels numbers
-            self.codegen.backpatching()
-            return '\n'.join(self.codegen.code)
+            self.pass_manager.run(self.codegen.code)
+        return not self.has_errors
+
+    def run(self):
+        if self.compile():
+            return '\n'.join(self.codegen.get_lines())
         return None
 
+    def emit(self, fp):
+        """
+        Write the compiled quad code to fp one line at a time,
+        so the program text is never built as a whole in memory
+        """
+        fp.writelines(line + '\n' for line in self.codegen.get_lines())
+
+    def emit_binary(self, fp):
+        """
+        Write the compiled quad code to the binary file object fp as quad bytecode
+        """
+        bytecode.write_bytecode(self.codegen.code, fp)
+
     def create_temp_vars(self):
         self.temp_vars = {
             'int': self.codegen.newtemp('int'),
@@ -174,6 +223,11 @@ class Compiler:
             elif expr.type != val_type:
                 expr_value = self.cast(expr_value, dest_type=val_type, alloc_temp=False)
 
+        insn = '{}{}'.format('R' if val_type == 'float' else 'I', 'ADD' if addop == '+' else 'SUB')
+        folded = self.fold_constant(insn, [expr_value, term_value], val_type)
+        if folded is not None:
+            return Attrs(folded, val_type)
+
         val = ADD(expr.value, term.value, is_sub=(addop == '-'))
         if addop == '+':
             self.codegen.ADD(self.temp_vars[val_type], expr_value, term_value, is_float=val_type == 'float')
@@ -206,6 +260,9 @@ class Compiler:
         """
         value can be a value of Number, ID or Temp
         """
+        folded = self.fold_constant('ITOR' if dest_type == 'float' else 'RTOI', [value], dest_type)
+        if folded is not None:
+            return folded
         dest = None
         if alloc_temp:
             if type(value) is not Temp:
@@ -239,6 +296,11 @@ class Compiler:
             elif term.type != val_type:
                 term_value = self.cast(term_value, dest_type=val_type, alloc_temp=False)
 
+        insn = '{}{}'.format('R' if val_type == 'float' else 'I', 'DIV' if mulop == '/' else 'MLT')
+        folded = self.fold_constant(insn, [term_value, factor_value], val_type)
+        if folded is not None:
+            return Attrs(folded, val_type)
+
         val = MUL(term.value, factor.value, is_div=(mulop == '/'))
         if mulop == '/':
             self.codegen.DIV(self.temp_vars[val_type], term_value, factor_value, is_float=val_type == 'float')
@@ -279,12 +341,7 @@ class Compiler:
         expr_value = self.get_value_from_attr(expr)
         if cast_type != expr.type:
             #add code of RTOI or ITOR
-            self.codegen.CAST(
-                self.temp_vars[cast_type],
-                expr_value,
-                cast_type == 'float'
-            )
-            expr.value = self.temp_vars[cast_type]
+            expr.value = self.cast(expr_value, cast_type)
         #change the type
         expr.type = cast_type
         return expr
@@ -310,8 +367,7 @@ class Compiler:
         else stmtlist_else
 
         To:
-        IASN self.temp_var['int'] boolexpr
-        JMPZ l_else self.temp_var['int']
+        boolexpr (jumps to l_else if false)
         stmtlist_then
         JUMP l_after
     l_else:
@@ -320,10 +376,8 @@ class Compiler:
         """
         l_after = self.codegen.newlabel()
         l_else = self.codegen.newlabel()
-        self.handle_boolexpr(if_stmt_ast[0])
-        #jump to l_else if boolexpr == 0
-        #the Then part
-        self.codegen.JMPZ(l_else, self.temp_vars['int'])
+        #jump to l_else if boolexpr is false, the Then part follows it
+        self.handle_boolexpr(if_stmt_ast[0], None, l_else)
         self.handle_stmt(if_stmt_ast[1])
         self.codegen.JUMP(l_after)
         #the Else part
@@ -339,19 +393,19 @@ class Compiler:
 
         To:
     l_boolexpr:
-        IASN self.temp_var['int'] boolexpr
-        JMPZ l_exit self.temp_var['int']
+        boolexpr (jumps to l_exit if false)
         stmt
         JMP l_boolexpr
     l_exit:
         """
+        if self.invert_loops:
+            self.handle_inverted_while_stmt(while_stmt_ast)
+            return
         l_boolexpr = self.codegen.newlabel()
         l_exit = self.codegen.newlabel()
-        #handle the while boolexpr
+        #handle the while boolexpr, jump to l_exit if it is false
         self.codegen.label(l_boolexpr)
-        self.handle_boolexpr(while_stmt_ast[0])
-        #jump to l_exit if boolexpr == 0
-        self.codegen.JMPZ(l_exit, self.temp_vars['int'])
+        self.handle_boolexpr(while_stmt_ast[0], None, l_exit)
         #mark the while as in-the-middle for BREAK statement purposes
         self.while_exit_label.append(l_exit)
         #handle the while body
@@ -361,6 +415,30 @@ class Compiler:
         self.codegen.JUMP(l_boolexpr)
         self.codegen.label(l_exit)
 
+    def handle_inverted_while_stmt(self, while_stmt_ast):
+        """
+        Translates:
+        while (boolexpr) stmt
+
+        To a guarded do-while, which takes a single jump per iteration:
+        boolexpr (jumps to l_exit if false)
+    l_body:
+        stmt
+        boolexpr (jumps to l_body if true)
+    l_exit:
+        """
+        l_body = self.codegen.newlabel()
+        l_exit = self.codegen.newlabel()
+        #the guard skips the loop if boolexpr is false at the start
+        self.handle_boolexpr(while_stmt_ast[0], None, l_exit)
+        self.codegen.label(l_body)
+        self.while_exit_label.append(l_exit)
+        self.handle_stmt(while_stmt_ast[1])
+        self.while_exit_label.pop()
+        #the test at the bottom jumps back to the body, and falls through to l_exit when it is false
+        self.handle_boolexpr(while_stmt_ast[0], l_body, None)
+        self.codegen.label(l_exit)
+
     def handle_switch_stmt(self, switch_stmt_ast):
         """
         Translates:
@@ -372,16 +450,14 @@ class Compiler:
 
         To:
         IASN tmp expression
-        if (tmp == case_1) case_1_stmtlist
-        else {
-            if (tmp == case_2) case_2_stmtlist
-            else {
-                if (tmp == case_3) case_3_stmtlist
-                else {
-                    default_stmtlist
-                }
-            }
-        }
+        a decision tree over the sorted case numbers (jumps to l_case_i or l_default)
+    l_case_1:
+        case_1_stmtlist
+        JUMP l_after
+        ...
+    l_default:
+        default_stmtlist
+    l_after:
         """
         tmp = self.codegen.newtemp('int')
         expr = self.handle_expression(switch_stmt_ast[0])
@@ -389,34 +465,57 @@ class Compiler:
         if expr.type != 'int':
             raise TypeMismatch('Expected switch expression to be of type `int`, got type `{}` instead'.format(expr.type))
         self.codegen.ASN(tmp, expr_value, is_float=False)
-        #create if-else for the switch cases
         caselist = switch_stmt_ast[1]
         self.assert_symbol(caselist[0], 'caselist')
-        start_if_ast = None
-        last_if_ast = None
-        #generate a nested if-else for the caselist
-        for case_num, case_stmtlist, case_lineno in caselist[1]:
-            boolexpr = ('relop', '==', ('temp', tmp, 'int'), ('number', ('int', case_num)))
-            then_stmt = ('stmt_block', ('stmt_block', case_stmtlist), case_lineno)
-            else_stmt = None
-            if_ast = ('if_stmt', [boolexpr, then_stmt], case_lineno)
-            if start_if_ast is None:
-                #the start if_ast to parse eventually
-                start_if_ast = if_ast
-            if last_if_ast:
-                #append if_ast as else part of the last if ast
-                last_if_ast[1].append(if_ast)
-            #mark this if_ast as the last_if_ast
-            last_if_ast = if_ast
-        #now add the default part as else part to the last_if_ast
+        l_after = self.codegen.newlabel()
+        l_default = self.codegen.newlabel()
+        case_labels = [self.codegen.newlabel() for _ in caselist[1]]
+        #case number -> label, the first case wins when a number repeats
+        cases = {}
+        for (case_num, _, _), case_label in zip(caselist[1], case_labels):
+            cases.setdefault(case_num, case_label)
+        self.switch_decision_tree(tmp, sorted(cases.items()), l_default, None, None)
+        for (_, case_stmtlist, case_lineno), case_label in zip(caselist[1], case_labels):
+            self.codegen.label(case_label)
+            self.handle_stmt(('stmt_block', ('stmt_block', case_stmtlist), case_lineno))
+            self.codegen.JUMP(l_after)
         default_case_stmtlist, default_case_lineno = switch_stmt_ast[2]
-        last_if_ast[1].append((
-                'stmt_block',
-                ('stmt_block', default_case_stmtlist),
-                default_case_lineno
-        ))
-        #handle the huge if stmt
-        self.handle_stmt(start_if_ast)
+        self.codegen.label(l_default)
+        self.handle_stmt(('stmt_block', ('stmt_block', default_case_stmtlist), default_case_lineno))
+        self.codegen.label(l_after)
+
+    def switch_decision_tree(self, tmp, cases, l_default, low, high):
+        """
+        Jumps to the label of the case that equals tmp, or to l_default, with a binary search over the cases.
+        A short list of cases is compared one by one, and a case that is the only value left
+        between the bounds is jumped to without comparing (as in a dense range of cases)
+        @param cases: sorted (case number, label) pairs
+        @param low, high: the bounds of tmp known from the comparisons so far, None if unknown
+        """
+        if len(cases) > SWITCH_LINEAR_CASES:
+            middle = len(cases) // 2
+            boundary = cases[middle][0]
+            l_right = self.codegen.newlabel()
+            #JMPZ to the upper half if tmp >= boundary
+            self.codegen.LSS(self.temp_vars['int'], tmp, Number(boundary, 'int'), is_float=False)
+            self.codegen.JMPZ(l_right, self.temp_vars['int'])
+            self.switch_decision_tree(tmp, cases[:middle], l_default, low, boundary - 1)
+            self.codegen.label(l_right)
+            self.switch_decision_tree(tmp, cases[middle:], l_default, boundary, high)
+            return
+        for case_num, case_label in cases:
+            if low == case_num == high:
+                self.codegen.JUMP(case_label)
+                return
+            #the NQL is 0 when tmp is the case number
+            self.codegen.NQL(self.temp_vars['int'], tmp, Number(case_num, 'int'), is_float=False)
+            self.codegen.JMPZ(case_label, self.temp_vars['int'])
+            if case_num == low:
+                low += 1
+        if low is not None and high is not None and low > high:
+            #every value between the bounds is a case
+            return
+        self.codegen.JUMP(l_default)
 
     def handle_break_stmt(self, break_stmt_ast):
         if not self.while_exit_label:
@@ -424,48 +523,47 @@ class Compiler:
         #jump to the closest while exit
         self.codegen.JUMP(self.while_exit_label[-1])
 
-    def handle_boolexpr(self, boolexpr_ast):
-        expr = None
+    def handle_boolexpr(self, boolexpr_ast, true_label, false_label):
+        """
+        Translates a boolean expression to jumps (short-circuit evaluation):
+        the code jumps to true_label if the expression is true and to false_label if it is false.
+        A label of None means falling through to the code that follows, only one of them can be None.
+
+        A || B is translated to:
+        A (jumps to true_label if true, falls through to B if false)
+        B (jumps to true_label if true, to false_label if false)
+        """
         if boolexpr_ast[0] == 'or':
-            boolexpr = self.handle_boolexpr(boolexpr_ast[1])
-            tmp = self.codegen.newtemp('int')
-            self.codegen.ASN(tmp, self.temp_vars['int'], is_float=False)
-            boolterm = self.handle_boolterm(boolexpr_ast[2])
-            #the result of boolterm is stored in self.temp_vars['int']
-            expr = OR(boolexpr, boolterm)
-            #OR is equivalent to A + B >= 1, i.e A + B > 0
-            self.codegen.ADD(self.temp_vars['int'], tmp, self.temp_vars['int'], is_float=False)
-            self.codegen.GRT(self.temp_vars['int'], self.temp_vars['int'], Number(0, 'int'), is_float=False)
+            #a true left side skips the right side
+            left_true_label = true_label if true_label is not None else self.codegen.newlabel()
+            self.handle_boolexpr(boolexpr_ast[1], left_true_label, None)
+            self.handle_boolterm(boolexpr_ast[2], true_label, false_label)
+            if true_label is None:
+                self.codegen.label(left_true_label)
         else:
-            boolterm = self.handle_boolterm(boolexpr_ast)
-            expr = boolterm
-        return expr
+            self.handle_boolterm(boolexpr_ast, true_label, false_label)
 
-    def handle_boolterm(self, boolterm_ast):
-        expr = None
+    def handle_boolterm(self, boolterm_ast, true_label, false_label):
+        """
+        Translates A && B to:
+        A (falls through to B if true, jumps to false_label if false)
+        B (jumps to true_label if true, to false_label if false)
+        """
         if boolterm_ast[0] == 'and':
-            boolterm = self.handle_boolterm(boolterm_ast[1])
-            tmp = self.codegen.newtemp('int')
-            self.codegen.ASN(tmp, self.temp_vars['int'], is_float=False)
-            boolfactor = self.handle_boolfactor(boolterm_ast[2])
-            #the result of boolfactor is stored in self.temp_vars['int']
-            expr = AND(boolterm, boolfactor)
-            #AND is equivalent to A + B == 2
-            self.codegen.ADD(self.temp_vars['int'], tmp, self.temp_vars['int'], is_float=False)
-            self.codegen.EQL(self.temp_vars['int'], self.temp_vars['int'], Number(2, 'int'), is_float=False)
+            #a false left side skips the right side
+            left_false_label = false_label if false_label is not None else self.codegen.newlabel()
+            self.handle_boolterm(boolterm_ast[1], None, left_false_label)
+            self.handle_boolfactor(boolterm_ast[2], true_label, false_label)
+            if false_label is None:
+                self.codegen.label(left_false_label)
         else:
-            boolfactor = self.handle_boolfactor(boolterm_ast)
-            expr = boolfactor
-        return expr
+            self.handle_boolfactor(boolterm_ast, true_label, false_label)
 
-    def handle_boolfactor(self, boolfactor_ast):
+    def handle_boolfactor(self, boolfactor_ast, true_label, false_label):
         self.assert_symbol_one_of(boolfactor_ast[0], 'not', 'relop')
-        expr = None
         if boolfactor_ast[0] == 'not':
-            boolexpr = self.handle_boolexpr(boolfactor_ast[1])
-            expr = NOT(boolexpr)
-            #if A = 0 then A = 1 else A = 0
-            self.codegen.EQL(self.temp_vars['int'], self.temp_vars['int'], Number(0, 'int'), is_float=False)
+            #!A just swaps the targets of A
+            self.handle_boolexpr(boolfactor_ast[1], false_label, true_label)
         elif boolfactor_ast[0] == 'relop':
             relop = boolfactor_ast[1]
             if relop == '>=':
@@ -474,34 +572,53 @@ class Compiler:
                 boolfactor_ast[1] = '<'
                 boolfactor_ast = tuple(boolfactor_ast)
                 not_ast = ('not', boolfactor_ast)
-                expr = self.handle_boolfactor(not_ast)
-            if relop == '<=':
+                self.handle_boolfactor(not_ast, true_label, false_label)
+            elif relop == '<=':
                 #translate <= to not bigger than
                 boolfactor_ast = list(boolfactor_ast)
                 boolfactor_ast[1] = '>'
                 boolfactor_ast = tuple(boolfactor_ast)
                 not_ast = ('not', boolfactor_ast)
-                expr = self.handle_boolfactor(not_ast)
+                self.handle_boolfactor(not_ast, true_label, false_label)
             else:
-                expression1 = self.handle_expression(boolfactor_ast[2])
-                expression1_value = self.get_value_from_attr(expression1, alloc_temp=True)
-                expression2 = self.handle_expression(boolfactor_ast[3])
-                expression2_value = self.get_value_from_attr(expression2)
-                
-                expr_type = self.type_max(expression1.type, expression2.type)
-
-                if expression1.type != expression2.type:
-                    if expression1.type != expr_type:
-                        expression1_value = self.cast(expression1_value, expr_type, alloc_temp=True)
-                    elif expression2.type != expr_type:
-                        expression2_value = self.cast(expression2_value, expr_type)
-                expr = RELOP(expression1, expression2, relop)
-                if relop == '==':
-                    self.codegen.EQL(self.temp_vars['int'], expression1_value, expression2_value, is_float=(expr_type == 'float'))
-                elif relop == '!=':
-                    self.codegen.NQL(self.temp_vars['int'], expression1_value, expression2_value, is_float=(expr_type == 'float'))
-                elif relop == '>':
-                    self.codegen.GRT(self.temp_vars['int'], expression1_value, expression2_value, is_float=(expr_type == 'float'))
-                elif relop == '<':
-                    self.codegen.LSS(self.temp_vars['int'], expression1_value, expression2_value, is_float=(expr_type == 'float'))
-        return expr
+                self.handle_relop(boolfactor_ast, true_label, false_label)
+
+    def handle_relop(self, relop_ast, true_label, false_label):
+        """
+        Translates a comparison to:
+        CMP self.temp_vars['int'] expression1 expression2
+        JMPZ false_label self.temp_vars['int']
+        JUMP true_label
+        If there is no false_label the comparison result is negated first, so JMPZ jumps when it is true
+        (the peephole pass turns the negation into a single comparison when it can)
+        """
+        relop = relop_ast[1]
+        expression1 = self.handle_expression(relop_ast[2])
+        expression1_value = self.get_value_from_attr(expression1, alloc_temp=True)
+        expression2 = self.handle_expression(relop_ast[3])
+        expression2_value = self.get_value_from_attr(expression2)
+
+        expr_type = self.type_max(expression1.type, expression2.type)
+
+        if expression1.type != expression2.type:
+            if expression1.type != expr_type:
+                expression1_value = self.cast(expression1_value, expr_type, alloc_temp=True)
+            elif expression2.type != expr_type:
+                expression2_value = self.cast(expression2_value, expr_type)
+        if relop == '==':
+            self.codegen.EQL(self.temp_vars['int'], expression1_value, expression2_value, is_float=(expr_type == 'float'))
+        elif relop == '!=':
+            self.codegen.NQL(self.temp_vars['int'], expression1_value, expression2_value, is_float=(expr_type == 'float'))
+        elif relop == '>':
+            self.codegen.GRT(self.temp_vars['int'], expression1_value, expression2_value, is_float=(expr_type == 'float'))
+        elif relop == '<':
+            self.codegen.LSS(self.temp_vars['int'], expression1_value, expression2_value, is_float=(expr_type == 'float'))
+
+        if false_label is None:
+            #if A = 0 then A = 1 else A = 0
+            self.codegen.EQL(self.temp_vars['int'], self.temp_vars['int'], Number(0, 'int'), is_float=False)
+            self.codegen.JMPZ(true_label, self.temp_vars['int'])
+        else:
+            self.codegen.JMPZ(false_label, self.temp_vars['int'])
+            if true_label is not None:
+                self.codegen.JUMP(true_label)
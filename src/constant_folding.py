@@ -0,0 +1,105 @@
+import re
+from .quad import OPCODES, OPCODE_IDS, ASSIGNING_OPS, USED_OPERANDS, JUMP, JMPZ, OPERAND_NUMBER
+
+#the float literals that tools/qx.py can read back from the quad code
+FLOAT_RE = re.compile(r'^[0-9]+\.[0-9]*$')
+
+#how tools/qx.py computes every instruction, by the instruction name without the type letter
+OPERATIONS = {
+    'ASN': lambda b: b,
+    'EQL': lambda b, c: int(b == c),
+    'NQL': lambda b, c: int(b != c),
+    'LSS': lambda b, c: int(b < c),
+    'GRT': lambda b, c: int(b > c),
+    'ADD': lambda b, c: b + c,
+    'SUB': lambda b, c: b - c,
+    'MLT': lambda b, c: b * c,
+}
+
+def is_encodable(value):
+    """
+    Checks that value can be written as a literal in the quad code
+    (there are no negative or exponent literals)
+    """
+    if type(value) is int:
+        return value >= 0
+    return FLOAT_RE.match(str(value)) is not None
+
+def fold(insn, values, encodable_only=True):
+    """
+    Computes the instruction insn on constant values the same way tools/qx.py does
+    @param insn: the instruction name, e.g. IADD
+    @param encodable_only: fail on results that can not be written as a literal
+    @returns the result, or None if it can not be computed at compile time
+    """
+    if insn in ('ITOR', 'RTOI'):
+        try:
+            result = float(values[0]) if insn == 'ITOR' else int(values[0])
+        except (OverflowError, ValueError):
+            #a too big int, or an inf or nan float, fails at runtime
+            return None
+    elif insn[1:] == 'DIV':
+        if values[1] == 0:
+            #leave division by zero to fail at runtime
+            return None
+        result = values[0] // values[1] if insn == 'IDIV' else values[0] / values[1]
+    elif insn[1:] in OPERATIONS:
+        result = OPERATIONS[insn[1:]](*values)
+    else:
+        return None
+    if encodable_only and not is_encodable(result):
+        return None
+    return result
+
+def result_type(insn):
+    if insn[1:] in ('EQL', 'NQL', 'LSS', 'GRT') or insn == 'RTOI':
+        return 'int'
+    elif insn == 'ITOR':
+        return 'float'
+    return 'int' if insn[0] == 'I' else 'float'
+
+def fold_constants(code):
+    """
+    Propagates constants through every basic block of code and folds the instructions
+    whose operands are all constants into an assignment of the result.
+    A JMPZ on a constant becomes a JUMP or is removed
+    @returns the number of removed instructions
+    """
+    removed = set()
+    leaders = code.block_leaders()
+    block_ends = leaders[1:] + [len(code)]
+    for block_start, block_end in zip(leaders, block_ends):
+        #variable or temp operand -> the constant operand it holds
+        known = {}
+        for insn_idx in range(block_start, block_end):
+            op = code.ops[insn_idx]
+            operands = code.operands(insn_idx)
+            for operand_idx in USED_OPERANDS[op]:
+                if operands[operand_idx] in known:
+                    operands[operand_idx] = known[operands[operand_idx]]
+                    code.set_operand(insn_idx, operand_idx, operands[operand_idx])
+
+            if op == JMPZ:
+                if operands[1][0] == OPERAND_NUMBER:
+                    if code.const_value(operands[1]) == 0:
+                        code.set_insn(insn_idx, JUMP, operands[:1])
+                    else:
+                        removed.add(insn_idx)
+                continue
+            if op not in ASSIGNING_OPS:
+                continue
+
+            dest = operands[0]
+            sources = [operands[operand_idx] for operand_idx in USED_OPERANDS[op]]
+            if sources and all(kind == OPERAND_NUMBER for kind, _ in sources):
+                insn = OPCODES[op]
+                result = fold(insn, [code.const_value(source) for source in sources])
+                if result is not None:
+                    asn = 'IASN' if result_type(insn) == 'int' else 'RASN'
+                    constant = code.number_operand(result)
+                    code.set_insn(insn_idx, OPCODE_IDS[asn], [dest, constant])
+                    known[dest] = constant
+                    continue
+            known.pop(dest, None)
+    code.remove(removed)
+    return len(removed)
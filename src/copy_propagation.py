@@ -0,0 +1,166 @@
+from .quad import OPCODES, ASSIGNING_OPS, USED_OPERANDS, NUMBER_OPERANDS, JUMP, OPERAND_ID, OPERAND_TEMP, OPERAND_NUMBER
+from .cfg import CFG, reverse_postorder
+from . import liveness
+
+COPY_INSNS = ('IASN', 'RASN')
+
+class Copies:
+    """
+    The available copies (dest -> source), with the destinations of every source that is not a number,
+    so an assignment kills its copies without looking at all of them
+    """
+    def __init__(self, sources=None, readers=None):
+        self.sources = sources if sources is not None else {}
+        self.readers = readers if readers is not None else {}
+
+    def copy(self):
+        return Copies(dict(self.sources), {source: set(dests) for source, dests in self.readers.items()})
+
+    def __eq__(self, other):
+        return isinstance(other, Copies) and self.sources == other.sources
+
+    def get(self, dest):
+        return self.sources.get(dest)
+
+    def add(self, dest, source):
+        self.sources[dest] = source
+        if source[0] != OPERAND_NUMBER:
+            self.readers.setdefault(source, set()).add(dest)
+
+    def remove(self, dest):
+        source = self.sources.pop(dest, None)
+        if source is not None and source[0] != OPERAND_NUMBER:
+            dests = self.readers[source]
+            dests.discard(dest)
+            #an empty entry would be copied along to every block after it
+            if not dests:
+                del self.readers[source]
+
+    def kill(self, operand):
+        """
+        Remove the copies that are no longer true after operand is assigned
+        """
+        self.remove(operand)
+        for dest in self.readers.pop(operand, ()):
+            del self.sources[dest]
+
+    def retain(self, live):
+        """
+        Keep only the copies to the operands in live
+        """
+        for dest in [dest for dest in self.sources if dest not in live]:
+            self.remove(dest)
+
+    def intersect(self, other):
+        """
+        Keep only the copies that are also in other
+        """
+        for dest in [dest for dest, source in self.sources.items() if other.sources.get(dest) != source]:
+            self.remove(dest)
+
+def propagate_block(code, block, copies, removed=None):
+    """
+    Run the copies of block over the available Copies.
+    With a removed set, the operands that are a copy destination are replaced by its source,
+    and a JMPZ on a copied number becomes a JUMP or is added to removed
+    """
+    for insn_idx in range(block.start, block.end):
+        op = code.ops[insn_idx]
+        if removed is not None:
+            for operand_idx in USED_OPERANDS[op]:
+                source = copies.get(code.operand(insn_idx, operand_idx))
+                if source is None:
+                    continue
+                if source[0] != OPERAND_NUMBER or operand_idx in NUMBER_OPERANDS[op]:
+                    code.set_operand(insn_idx, operand_idx, source)
+                elif code.const_value(source) == 0:
+                    code.set_insn(insn_idx, JUMP, [code.operand(insn_idx, 0)])
+                else:
+                    removed.add(insn_idx)
+        if op not in ASSIGNING_OPS:
+            continue
+        dest = code.operand(insn_idx, 0)
+        copies.kill(dest)
+        if OPCODES[op] in COPY_INSNS:
+            source = code.operand(insn_idx, 1)
+            #a temp copied to a variable is left for coalesce_copies to compute straight into the variable
+            if source != dest and not (source[0] == OPERAND_TEMP and dest[0] == OPERAND_ID):
+                copies.add(dest, source)
+
+def propagate_copies(code):
+    """
+    Copy propagation: a read of d after ASN d s reads s instead, as long as neither of them
+    is assigned on any path in between. The copies that are left unread are removed as dead stores
+    @returns the number of removed instructions
+    """
+    cfg = CFG(code)
+    order = reverse_postorder(cfg)
+    #a copy to an operand that is dead can not be read, dropping it keeps the copies small
+    live_outs = liveness.live_out(cfg)
+    #block index -> the copies available at its end, None before the block is first visited
+    outs = [None] * len(cfg.blocks)
+    changed = True
+    while changed:
+        changed = False
+        for block in order:
+            copies = block_in(block, outs)
+            propagate_block(code, block, copies)
+            copies.retain(live_outs[block.index])
+            if copies != outs[block.index]:
+                outs[block.index] = copies
+                changed = True
+    removed = set()
+    for block in order:
+        propagate_block(code, block, block_in(block, outs), removed)
+    code.remove(removed)
+    return len(removed)
+
+def block_in(block, outs):
+    if block.index == 0:
+        return Copies()
+    pred_outs = [outs[pred.index] for pred in block.preds if outs[pred.index] is not None]
+    if not pred_outs:
+        return Copies()
+    copies = pred_outs[0].copy()
+    for pred_out in pred_outs[1:]:
+        copies.intersect(pred_out)
+    return copies
+
+def coalesce_copies(code):
+    """
+    Compute straight into the destination of a copy: op t b c ... ASN x t becomes op x b c,
+    if t is not read again, and x is not read or assigned in between
+    @returns the number of removed instructions
+    """
+    cfg = CFG(code)
+    live_outs = liveness.live_out(cfg)
+    removed = set()
+    for block in cfg.blocks:
+        live = set(live_outs[block.index])
+        for insn_idx in range(block.end - 1, block.start - 1, -1):
+            if OPCODES[code.ops[insn_idx]] in COPY_INSNS:
+                dest, temp = code.operands(insn_idx)
+                if temp[0] == OPERAND_TEMP and temp not in live and temp != dest:
+                    def_idx = copied_def(code, block, insn_idx, dest, temp)
+                    if def_idx is not None:
+                        code.set_operand(def_idx, 0, dest)
+                        removed.add(insn_idx)
+                        #dest is now assigned at def_idx, and temp is not read
+                        continue
+            liveness.transfer(code, insn_idx, live)
+    code.remove(removed)
+    return len(removed)
+
+def copied_def(code, block, copy_idx, dest, temp):
+    """
+    Find the assignment of temp that the copy at copy_idx reads, in the same block
+    @returns its index, or None if something else reads temp or touches dest after it
+    """
+    for insn_idx in range(copy_idx - 1, block.start - 1, -1):
+        if temp in liveness.defs(code, insn_idx):
+            #it may read dest and temp, they are read before it assigns
+            return insn_idx
+        if dest in liveness.defs(code, insn_idx) or dest in liveness.uses(code, insn_idx) or \
+                temp in liveness.uses(code, insn_idx):
+            return None
+    return None
@@ -0,0 +1,114 @@
+from .quad import OPCODES, ASSIGNING_OPS, HALT, OPERAND_NUMBER
+from .cfg import CFG
+from .peephole import jumps_to_next
+from . import liveness
+
+#instructions that do more than assigning their first operand
+SIDE_EFFECT_INSNS = ('IINP', 'RINP')
+
+def reachable_blocks(cfg):
+    reachable = set()
+    stack = cfg.blocks[:1]
+    while stack:
+        block = stack.pop()
+        if block.index in reachable:
+            continue
+        reachable.add(block.index)
+        stack.extend(block.succs)
+    return reachable
+
+def is_removable(code, insn_idx):
+    """
+    Checks if insn_idx only assigns its first operand, so it can be removed when that value is never read.
+    A division is kept unless its divisor is a non zero constant, since it may fail at runtime
+    """
+    op = code.ops[insn_idx]
+    insn = OPCODES[op]
+    if op not in ASSIGNING_OPS or insn in SIDE_EFFECT_INSNS:
+        return False
+    if insn in ('IDIV', 'RDIV'):
+        divisor = code.operand(insn_idx, 2)
+        return divisor[0] == OPERAND_NUMBER and code.const_value(divisor) != 0
+    return True
+
+def remove_unreachable(code):
+    """
+    Remove the basic blocks that can not be reached from the start of the program.
+    The final HALT is always kept, tools/qx.py requires it even if the program never ends
+    @returns the number of removed instructions
+    """
+    cfg = CFG(code)
+    reachable = reachable_blocks(cfg)
+    removed = set()
+    for block in cfg.blocks:
+        if block.index not in reachable:
+            removed.update(range(block.start, block.end))
+    if code.ops[len(code) - 1] == HALT:
+        removed.discard(len(code) - 1)
+    code.remove(removed)
+    return len(removed)
+
+def is_dead_store(code, insn_idx, live):
+    return code.operand(insn_idx, 0) not in live and is_removable(code, insn_idx)
+
+def faint_live_out(cfg):
+    """
+    Live variable analysis where an assignment that can be removed reads its operands only if
+    the operand it assigns is live. So a chain of copies that are never read is dead at once,
+    and so is a variable that is only read to compute itself, like a counter nothing else reads
+    @returns a list with the set of variables and temps that are live at the end of every block
+    """
+    code = cfg.code
+    live_in = [set() for _ in cfg.blocks]
+    live_outs = [set() for _ in cfg.blocks]
+    changed = True
+    while changed:
+        changed = False
+        #backwards, so most of the information flows in the first round
+        for block in reversed(cfg.blocks):
+            out = live_outs[block.index]
+            for succ in block.succs:
+                out |= live_in[succ.index]
+            live = set(out)
+            for insn_idx in range(block.end - 1, block.start - 1, -1):
+                if not is_dead_store(code, insn_idx, live):
+                    liveness.transfer(code, insn_idx, live)
+            if live != live_in[block.index]:
+                live_in[block.index] = live
+                changed = True
+    return live_outs
+
+def remove_dead_stores(code):
+    """
+    Remove the assignments whose value is never read, or is read only by assignments that are removed
+    @returns the number of removed instructions
+    """
+    cfg = CFG(code)
+    live_outs = faint_live_out(cfg)
+    removed = set()
+    for block in cfg.blocks:
+        live = set(live_outs[block.index])
+        for insn_idx in range(block.end - 1, block.start - 1, -1):
+            if is_dead_store(code, insn_idx, live):
+                #its operands are not read either, so they are not made live
+                removed.add(insn_idx)
+                continue
+            liveness.transfer(code, insn_idx, live)
+    code.remove(removed)
+    return len(removed)
+
+def eliminate_dead_code(code):
+    """
+    Remove unreachable blocks, dead stores and jumps to the next instruction.
+    Removing a JMPZ leaves the comparison it read dead, and removing that may empty the if around it,
+    so they are removed until none are left
+    @returns the number of removed instructions
+    """
+    total_removed = remove_unreachable(code)
+    while True:
+        total_removed += remove_dead_stores(code)
+        removed = set()
+        if not jumps_to_next(code, removed):
+            return total_removed
+        code.remove(removed)
+        total_removed += len(removed)
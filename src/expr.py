@@ -25,16 +25,18 @@ class Number(Expr):
         return self.value
 
 class Temp(Expr):
-    def __init__(self, name, var_type):
-        self.name = name
+    def __init__(self, index, var_type):
+        self.index = index
+        self.name = 't{}'.format(index)
         self.type = var_type
 
     def get_value(self):
         return self.name
 
 class Label(Expr):
-    def __init__(self, name):
-        self.name = name
+    def __init__(self, index):
+        self.index = index
+        self.name = 'l{}'.format(index)
         self.type = None
 
     def get_value(self):
@@ -50,24 +52,4 @@ class MUL(Expr):
     def __init__(self, a, b, is_div=False):
         self.a = a
         self.b = b
-        self.is_div = is_div
-
-class NOT(Expr):
-    def __init__(self, value):
-        self.value = value
-
-class OR(Expr):
-    def __init__(self, a, b):
-        self.a = a
-        self.b = b
-
-class AND(Expr):
-    def __init__(self, a, b):
-        self.a = a
-        self.b = b
-
-class RELOP(Expr):
-    def __init__(self, a, b, relop):
-        self.a = a
-        self.b = b
-        self.relop = relop
\ No newline at end of file
+        self.is_div = is_div
\ No newline at end of file
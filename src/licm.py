@@ -0,0 +1,314 @@
+from .quad import OPCODES, OPCODE_IDS, ASSIGNING_OPS, USED_OPERANDS, NUMBER_OPERANDS, JUMP, JMPZ, OPERAND_TEMP, OPERAND_NUMBER, OPERAND_LABEL
+from .cfg import CFG, DominatorTree, immediate_dominators, natural_loops
+from .constant_folding import result_type
+from . import liveness
+
+#instructions that are never hoisted: input has a side effect, and hoisting a copy gains nothing
+NOT_HOISTED_INSNS = ('IINP', 'RINP', 'IASN', 'RASN')
+#an instruction that could fail is not hoisted past these, the failure would hide their effect
+IO_INSNS = ('IINP', 'RINP', 'IPRT', 'RPRT')
+
+def may_fail(code, insn_idx, sources):
+    """
+    Checks if the instruction can fail at runtime in tools/qx.py:
+    a division unless by a non zero constant, and conversions of too big numbers
+    """
+    insn = OPCODES[code.ops[insn_idx]]
+    if insn in ('IDIV', 'RDIV'):
+        return sources[1][0] != OPERAND_NUMBER or code.const_value(sources[1]) == 0
+    return insn in ('ITOR', 'RTOI')
+
+def assigned_out(cfg):
+    """
+    Definitely assigned variables analysis
+    @returns a list with the set of variables and temps that are assigned on every path to the end of every block
+    """
+    code = cfg.code
+    block_defs = []
+    everything = set()
+    for block in cfg.blocks:
+        defined = set()
+        for insn_idx in range(block.start, block.end):
+            defined.update(liveness.defs(code, insn_idx))
+        block_defs.append(defined)
+        everything |= defined
+
+    outs = [set(everything) for _ in cfg.blocks]
+    changed = True
+    while changed:
+        changed = False
+        for block in cfg.blocks:
+            if block.index == 0 or not block.preds:
+                block_in = set()
+            else:
+                block_in = set.intersection(*(outs[pred.index] for pred in block.preds))
+            block_out = block_in | block_defs[block.index]
+            if block_out != outs[block.index]:
+                outs[block.index] = block_out
+                changed = True
+    return outs
+
+class LoopRound:
+    """
+    The analyses of the code that the loop transformations of a round of transform_loops share.
+    The instructions that a transformation inserts are kept until the round ends,
+    so the instruction indices of the analyses stay right for all the loops of the round
+    """
+    def __init__(self, code):
+        self.code = code
+        self.cfg = CFG(code)
+        idom = immediate_dominators(self.cfg)
+        self.tree = DominatorTree(idom)
+        self.loops = natural_loops(self.cfg, idom)
+        self.live_outs = liveness.live_out(self.cfg)
+        self.assigned_outs = assigned_out(self.cfg)
+        #(instruction index, instructions, label to put after them or None)
+        self.inserts = []
+
+    def insert(self, insn_idx, insns, label=None):
+        """
+        Insert the instructions insns, a list of (op, operands), before insn_idx when the round ends
+        """
+        self.inserts.append((insn_idx, insns, label))
+
+    def end(self, insn_indices):
+        """
+        Insert the instructions of the round
+        @param insn_indices: instruction indices before the insertions
+        @returns their indices after the insertions
+        """
+        code = self.code
+        #from the end, so the indices of the next insertions stay the same
+        for insn_idx, insns, label in sorted(self.inserts, key=lambda insert: insert[0], reverse=True):
+            code.insert(insn_idx, insns)
+            if label is not None:
+                code.labels[label] = insn_idx + len(insns)
+        return [
+            insn_idx + sum(len(insns) for insert_idx, insns, _ in self.inserts if insert_idx < insn_idx)
+            for insn_idx in insn_indices
+        ]
+
+def transform_loops(code, transform):
+    """
+    Run transform(code, loop_round, header, body) on every loop, the inner loops first,
+    with the LoopRound of the code and the header block and the block indices of the loop.
+    transform changes the instructions of the loop in place and inserts new ones with loop_round.insert.
+    A loop around a loop that changed would not see the inserted instructions, so it is left to the next round,
+    and the analyses are computed again only for them. The other loops are transformed once
+    @returns the sum of the results of transform
+    """
+    total = 0
+    #the start indices of the headers of the loops left to the next round, None for all the loops
+    pending = None
+    while pending is None or pending:
+        loop_round = LoopRound(code)
+        changed_blocks = set()
+        deferred = []
+        for header, body in loop_round.loops:
+            header = loop_round.cfg.blocks[header]
+            if pending is not None and header.start not in pending:
+                continue
+            #loops are nested or disjoint, and the inner loops come first
+            if body & changed_blocks:
+                deferred.append(header.start)
+                continue
+            changed = transform(code, loop_round, header, body)
+            if changed:
+                total += changed
+                changed_blocks |= body
+        pending = set(loop_round.end(deferred))
+    return total
+
+def hoist_loop_invariants(code):
+    """
+    Move the computations whose operands do not change inside a loop to a preheader,
+    that runs once before the loop header (the l_boolexpr label of a while loop).
+    A hoisted instruction d = b op c computes a new temp in the preheader, and becomes d = temp in the loop.
+    An instruction that could fail is hoisted only if it runs whenever the loop is entered,
+    before any input or output of the loop, and input is never hoisted
+    @returns the number of hoisted instructions
+    """
+    return transform_loops(code, hoist_loop)
+
+def hoist_loop(code, loop_round, header, body):
+    """
+    Hoist the invariant instructions of a single loop
+    @param loop_round: the LoopRound of code
+    @param header: the loop header block
+    @param body: the indices of the loop blocks
+    @returns the number of hoisted instructions
+    """
+    if not can_insert_preheader(code, header, body):
+        return 0
+    cfg = loop_round.cfg
+    blocks = sorted((cfg.blocks[index] for index in body), key=lambda block: block.start)
+    exits = [block for block in blocks if any(succ.index not in body for succ in block.succs)]
+    #the blocks that run whenever the loop is entered
+    always_runs = {
+        block.index for block in blocks
+        if exits and all(loop_round.tree.dominates(block.index, exit_block.index) for exit_block in exits)
+    }
+    io_before = io_before_blocks(code, header, body, blocks)
+
+    assigned_on_entry = assigned_before_loop(loop_round.assigned_outs, header, body)
+
+    live_in_header = set(loop_round.live_outs[header.index])
+    for insn_idx in range(header.end - 1, header.start - 1, -1):
+        liveness.transfer(code, insn_idx, live_in_header)
+
+    #operand -> the instructions in the loop that assign it
+    loop_defs = {}
+    for block in blocks:
+        for insn_idx in range(block.start, block.end):
+            for operand in liveness.defs(code, insn_idx):
+                loop_defs.setdefault(operand, []).append(insn_idx)
+
+    #instruction index -> the invariant operand it assigns (the new temp of a hoisted instruction)
+    values = {}
+    #operand -> its invariant value, for operands that are assigned once in the loop before any use
+    single_values = {}
+    preheader = []
+    changed = True
+    while changed:
+        changed = False
+        for block in blocks:
+            #operand -> the last instruction in this block that assigns it
+            last_def = {}
+            io_seen = block.index in io_before
+            for insn_idx in range(block.start, block.end):
+                op = code.ops[insn_idx]
+                if OPCODES[op] in IO_INSNS:
+                    io_seen = True
+                if op not in ASSIGNING_OPS:
+                    continue
+                dest = code.operand(insn_idx, 0)
+                if insn_idx not in values:
+                    value = invariant_value(
+                        code, insn_idx, block.index in always_runs and not io_seen, last_def, values,
+                        single_values, loop_defs, assigned_on_entry, preheader
+                    )
+                    if value is not None:
+                        values[insn_idx] = value
+                        changed = True
+                        if len(loop_defs[dest]) == 1 and dest not in live_in_header:
+                            single_values[dest] = value
+                last_def[dest] = insn_idx
+    if not preheader:
+        return 0
+
+    #the loop reads the invariant values directly, and the hoisted instructions just copy their temp
+    #(the copies are removed as dead stores when nothing else reads them)
+    for block in blocks:
+        last_def = {}
+        for insn_idx in range(block.start, block.end):
+            op = code.ops[insn_idx]
+            for operand_idx in USED_OPERANDS[op]:
+                operand = code.operand(insn_idx, operand_idx)
+                if operand in last_def:
+                    value = values.get(last_def[operand])
+                else:
+                    value = single_values.get(operand)
+                if value is not None and (value[0] != OPERAND_NUMBER or operand_idx in NUMBER_OPERANDS[op]):
+                    code.set_operand(insn_idx, operand_idx, value)
+            if op not in ASSIGNING_OPS:
+                continue
+            dest = code.operand(insn_idx, 0)
+            if insn_idx in values and OPCODES[op] not in NOT_HOISTED_INSNS:
+                asn = 'IASN' if code.temps[values[insn_idx][1]] == 'int' else 'RASN'
+                code.set_insn(insn_idx, OPCODE_IDS[asn], [dest, values[insn_idx]])
+            last_def[dest] = insn_idx
+
+    insert_preheader(code, loop_round, header, body, preheader)
+    return len(preheader)
+
+def io_before_blocks(code, header, body, blocks):
+    """
+    Find the blocks of a loop that input or output can run before, from the loop entry
+    to the first time they run
+    @param blocks: the blocks of the loop
+    @returns a set of block indices
+    """
+    io_blocks = {
+        block.index for block in blocks
+        if any(OPCODES[code.ops[insn_idx]] in IO_INSNS for insn_idx in range(block.start, block.end))
+    }
+    io_before = set()
+    changed = True
+    while changed:
+        changed = False
+        for block in blocks:
+            #the header runs first, the edges back to it start another iteration
+            if block.index == header.index or block.index in io_before:
+                continue
+            if any(pred.index in io_blocks or pred.index in io_before for pred in block.preds if pred.index in body):
+                io_before.add(block.index)
+                changed = True
+    return io_before
+
+def can_insert_preheader(code, header, body):
+    #the preheader is put right before the header, so no block of the loop may fall through to the header
+    return not any(
+        pred.index in body and pred.end == header.start and code.ops[pred.end - 1] != JUMP
+        for pred in header.preds
+    )
+
+def insert_preheader(code, loop_round, header, body, insns):
+    """
+    Insert the instructions insns, a list of (op, operands), right before the loop header when the round ends,
+    so they run once whenever the loop is entered. The jumps back to the header skip them
+    """
+    header_label = code.new_label()
+    code.labels[header_label] = header.start
+    for index in body:
+        last_idx = loop_round.cfg.blocks[index].end - 1
+        if code.ops[last_idx] in (JUMP, JMPZ) and code.labels[code.operand(last_idx, 0)[1]] == header.start:
+            code.set_operand(last_idx, 0, (OPERAND_LABEL, header_label))
+    loop_round.insert(header.start, insns, header_label)
+
+def assigned_before_loop(assigned_outs, header, body):
+    """
+    The variables and temps that are assigned on every path that enters the loop
+    @param assigned_outs: the result of assigned_out
+    """
+    outside_preds = [pred for pred in header.preds if pred.index not in body]
+    if not outside_preds:
+        return set()
+    return set.intersection(*(assigned_outs[pred.index] for pred in outside_preds))
+
+def invariant_value(code, insn_idx, runs_first, last_def, values, single_values, loop_defs, assigned_on_entry,
+                    preheader):
+    """
+    Find the value that insn_idx assigns if it is the same in every iteration of the loop.
+    A computation is added to the preheader, copies just pass the value on
+    @param runs_first: whether insn_idx runs whenever the loop is entered, before any input or output,
+    so it can fail in the preheader instead
+    @returns the invariant operand, or None
+    """
+    op = code.ops[insn_idx]
+    insn = OPCODES[op]
+    if insn in ('IINP', 'RINP'):
+        return None
+    sources = []
+    for operand_idx in USED_OPERANDS[op]:
+        operand = code.operand(insn_idx, operand_idx)
+        if operand[0] == OPERAND_NUMBER:
+            source = operand
+        elif operand in last_def:
+            #assigned earlier in the same block
+            source = values.get(last_def[operand])
+        elif operand not in loop_defs:
+            #reading a variable that was never assigned fails in tools/qx.py
+            source = operand if runs_first or operand in assigned_on_entry else None
+        else:
+            source = single_values.get(operand)
+        if source is None:
+            return None
+        sources.append(source)
+    if insn in NOT_HOISTED_INSNS:
+        return sources[0]
+    if not runs_first and may_fail(code, insn_idx, sources):
+        return None
+    temp = code.new_temp(result_type(insn))
+    value = (OPERAND_TEMP, temp)
+    preheader.append((op, [value] + sources))
+    return value
@@ -0,0 +1,61 @@
+from .quad import ASSIGNING_OPS, USED_OPERANDS, OPERAND_ID, OPERAND_TEMP
+
+def uses(code, insn_idx):
+    """
+    The variables and temps that insn_idx reads, as operands
+    """
+    used = []
+    for operand_idx in USED_OPERANDS[code.ops[insn_idx]]:
+        operand = code.operand(insn_idx, operand_idx)
+        if operand[0] == OPERAND_ID or operand[0] == OPERAND_TEMP:
+            used.append(operand)
+    return used
+
+def defs(code, insn_idx):
+    """
+    The variable or temp that insn_idx writes, as a list of operands
+    """
+    if code.ops[insn_idx] in ASSIGNING_OPS:
+        return [code.operand(insn_idx, 0)]
+    return []
+
+def transfer(code, insn_idx, live):
+    """
+    Turn the set of operands live after insn_idx to the set of operands live before it
+    """
+    for operand in defs(code, insn_idx):
+        live.discard(operand)
+    live.update(uses(code, insn_idx))
+
+def live_out(cfg):
+    """
+    Live variable analysis
+    @returns a list with the set of variables and temps that are live at the end of every block
+    """
+    code = cfg.code
+    block_uses = []
+    block_defs = []
+    for block in cfg.blocks:
+        used = set()
+        defined = set()
+        for insn_idx in range(block.start, block.end):
+            used.update(operand for operand in uses(code, insn_idx) if operand not in defined)
+            defined.update(defs(code, insn_idx))
+        block_uses.append(used)
+        block_defs.append(defined)
+
+    live_in = [set() for _ in cfg.blocks]
+    live_outs = [set() for _ in cfg.blocks]
+    changed = True
+    while changed:
+        changed = False
+        #backwards, so most of the information flows in the first round
+        for block in reversed(cfg.blocks):
+            out = live_outs[block.index]
+            for succ in block.succs:
+                out |= live_in[succ.index]
+            block_in = block_uses[block.index] | (out - block_defs[block.index])
+            if block_in != live_in[block.index]:
+                live_in[block.index] = block_in
+                changed = True
+    return live_outs
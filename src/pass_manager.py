@@ -0,0 +1,93 @@
+import time
+from collections import namedtuple
+
+from . import constant_folding
+from . import simplify
+from . import sccp
+from . import value_numbering
+from . import peephole
+from . import licm
+from . import copy_propagation
+from . import dead_code
+from . import temp_allocation
+
+#the optimization passes that run on the generated code, in this order, by name.
+#a name can appear more than once, enabling or disabling it applies to all of its runs
+PIPELINE = [
+    ('constant_folding', constant_folding.fold_constants),
+    ('simplify', simplify.simplify),
+    ('sccp', sccp.propagate_constants),
+    ('value_numbering', value_numbering.number_values),
+    ('peephole', peephole.peephole),
+    ('licm', licm.hoist_loop_invariants),
+    ('induction_variables', simplify.reduce_induction_variables),
+    #the preheaders of nested loops may compute the same values
+    ('value_numbering', value_numbering.number_values),
+    ('copy_propagation', copy_propagation.propagate_copies),
+    ('dead_code', dead_code.eliminate_dead_code),
+    #after the dead copies are gone, so the temps are read just once
+    ('coalesce_copies', copy_propagation.coalesce_copies),
+    #removing code leaves jumps to the next instruction
+    ('peephole', peephole.peephole),
+    #removing a JMPZ leaves the comparison it read dead
+    ('dead_code', dead_code.eliminate_dead_code),
+    #renames the temps, so it runs last
+    ('temp_allocation', temp_allocation.allocate_temps),
+]
+
+#options of the code generation that are enabled and disabled like the passes
+CODEGEN_OPTIONS = ('loop_inversion',)
+
+PASS_NAMES = tuple(sorted(set(name for name, _ in PIPELINE) | set(CODEGEN_OPTIONS)))
+
+#the passes of every optimization level
+OPT_LEVELS = {
+    0: frozenset(),
+    #the passes that work on a block or an instruction at a time
+    1: frozenset(('constant_folding', 'simplify', 'peephole', 'dead_code', 'temp_allocation')),
+    #induction_variables only pays off on big integers, so no level enables it
+    2: frozenset(PASS_NAMES) - {'induction_variables'},
+}
+
+PassStats = namedtuple('PassStats', ['name', 'seconds', 'insns_before', 'insns_after'])
+
+def enabled_passes(level, enable=(), disable=()):
+    """
+    @param level: an optimization level in OPT_LEVELS
+    @param enable, disable: names of passes to add to or remove from the level
+    @returns the set of the enabled pass names
+    """
+    for name in list(enable) + list(disable):
+        if name not in PASS_NAMES:
+            raise ValueError('unknown optimization pass `{}`'.format(name))
+    return (OPT_LEVELS[level] | set(enable)) - set(disable)
+
+class PassManager:
+    """
+    Runs the enabled passes of PIPELINE on a QuadCode,
+    and keeps the time and the instruction count of every run
+    """
+    def __init__(self, enabled):
+        self.enabled = frozenset(enabled)
+        self.passes = [(name, function) for name, function in PIPELINE if name in self.enabled]
+        self.stats = []
+
+    def run(self, code):
+        for name, function in self.passes:
+            insns_before = len(code)
+            start = time.perf_counter()
+            function(code)
+            self.stats.append(PassStats(name, time.perf_counter() - start, insns_before, len(code)))
+
+    def format_stats(self):
+        """
+        @returns the lines of a table of the pass runs
+        """
+        lines = ['{:<20} {:>10} {:>8} {:>8}'.format('pass', 'time (ms)', 'before', 'after')]
+        for stats in self.stats:
+            lines.append('{:<20} {:>10.2f} {:>8} {:>8}'.format(
+                stats.name, stats.seconds * 1000, stats.insns_before, stats.insns_after
+            ))
+        total = sum(stats.seconds for stats in self.stats)
+        lines.append('{:<20} {:>10.2f}'.format('total', total * 1000))
+        return lines
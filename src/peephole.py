@@ -0,0 +1,154 @@
+from .quad import OPCODES, OPCODE_IDS, USED_OPERANDS, NUMBER_OPERANDS, JUMP, JMPZ, OPERAND_TEMP, OPERAND_NUMBER
+
+IEQL = OPCODE_IDS['IEQL']
+ILSS = OPCODE_IDS['ILSS']
+IGRT = OPCODE_IDS['IGRT']
+
+#comparisons whose negation is a single comparison of the same operands
+NEGATED_COMPARES = {
+    OPCODE_IDS['IEQL']: OPCODE_IDS['INQL'],
+    OPCODE_IDS['INQL']: OPCODE_IDS['IEQL'],
+    OPCODE_IDS['REQL']: OPCODE_IDS['RNQL'],
+    OPCODE_IDS['RNQL']: OPCODE_IDS['REQL'],
+}
+
+#all the patterns, in the order they are tried
+PEEPHOLE_PATTERNS = (
+    'forward_copies',
+    'negated_compares',
+    'jump_chains',
+    'jumps_to_next',
+)
+
+def peephole(code, patterns=PEEPHOLE_PATTERNS):
+    """
+    Rewrite small instruction patterns of code until none of them is left:
+        forward_copies - ASN tN x followed by the only use of tN: use x there instead
+        negated_compares - a comparison followed by IEQL d d 0: emit the negated comparison
+        jump_chains - a jump to a JUMP: jump straight to its target
+        jumps_to_next - a JUMP or JMPZ to the next instruction: remove it
+    @param patterns: the names of the patterns to apply, out of PEEPHOLE_PATTERNS
+    @returns the number of removed instructions
+    """
+    total_removed = 0
+    while True:
+        removed = set()
+        changed = False
+        targets = set(code.labels)
+        if 'forward_copies' in patterns:
+            changed |= forward_copies(code, targets, removed)
+        if 'negated_compares' in patterns:
+            changed |= negated_compares(code, targets, removed)
+        if 'jump_chains' in patterns:
+            changed |= jump_chains(code)
+        if 'jumps_to_next' in patterns:
+            changed |= jumps_to_next(code, removed)
+        code.remove(removed)
+        total_removed += len(removed)
+        if not changed:
+            return total_removed
+
+def temp_uses(code):
+    uses = {}
+    for insn_idx, op in enumerate(code.ops):
+        for operand_idx in USED_OPERANDS[op]:
+            operand = code.operand(insn_idx, operand_idx)
+            if operand[0] == OPERAND_TEMP:
+                uses[operand] = uses.get(operand, 0) + 1
+    return uses
+
+def forward_copies(code, targets, removed):
+    uses = temp_uses(code)
+    changed = False
+    for insn_idx in range(len(code) - 1):
+        if insn_idx in removed or OPCODES[code.ops[insn_idx]] not in ('IASN', 'RASN'):
+            continue
+        temp, source = code.operands(insn_idx)
+        next_idx = insn_idx + 1
+        #the copy must be the only way to reach the use
+        if temp[0] != OPERAND_TEMP or uses.get(temp) != 1 or next_idx in targets:
+            continue
+        use_slots = [
+            operand_idx for operand_idx in USED_OPERANDS[code.ops[next_idx]]
+            if code.operand(next_idx, operand_idx) == temp
+        ]
+        if not use_slots or source[0] == OPERAND_NUMBER and \
+                any(operand_idx not in NUMBER_OPERANDS[code.ops[next_idx]] for operand_idx in use_slots):
+            continue
+        for operand_idx in use_slots:
+            code.set_operand(next_idx, operand_idx, source)
+        removed.add(insn_idx)
+        changed = True
+    return changed
+
+def negated_compare(code, op, a, b):
+    """
+    @returns the (op, a, b) of a single comparison that is the negation of op a b, or None
+    """
+    if op in NEGATED_COMPARES:
+        return (NEGATED_COMPARES[op], a, b)
+    if op not in (ILSS, IGRT):
+        return None
+    #integers only: not(a < b) is a > b - 1, and not(a > b) is a < b + 1
+    delta = -1 if op == ILSS else 1
+    negated_op = IGRT if op == ILSS else ILSS
+    if b[0] == OPERAND_NUMBER and code.const_value(b) + delta >= 0:
+        return (negated_op, a, code.number_operand(code.const_value(b) + delta))
+    if a[0] == OPERAND_NUMBER and code.const_value(a) - delta >= 0:
+        #not(a < b) is a + 1 > b, and not(a > b) is a - 1 < b
+        return (negated_op, code.number_operand(code.const_value(a) - delta), b)
+    return None
+
+def negated_compares(code, targets, removed):
+    changed = False
+    for insn_idx in range(len(code) - 1):
+        next_idx = insn_idx + 1
+        if insn_idx in removed or code.ops[next_idx] != IEQL or next_idx in targets:
+            continue
+        dest, value, zero = code.operands(next_idx)
+        if dest != value or zero[0] != OPERAND_NUMBER or code.const_value(zero) != 0:
+            continue
+        op = code.ops[insn_idx]
+        if op not in NEGATED_COMPARES and op not in (ILSS, IGRT):
+            continue
+        compare_dest, a, b = code.operands(insn_idx)
+        if compare_dest != dest:
+            continue
+        negated = negated_compare(code, op, a, b)
+        if negated is None:
+            continue
+        negated_op, a, b = negated
+        code.set_insn(insn_idx, negated_op, [dest, a, b])
+        removed.add(next_idx)
+        changed = True
+    return changed
+
+def jump_chains(code):
+    changed = False
+    for insn_idx, op in enumerate(code.ops):
+        if op != JUMP and op != JMPZ:
+            continue
+        first_label = label = code.operand(insn_idx, 0)
+        seen = {label}
+        while True:
+            target = code.labels[label[1]]
+            if target >= len(code) or code.ops[target] != JUMP:
+                break
+            label = code.operand(target, 0)
+            if label in seen:
+                #a loop of jumps that never ends, leave it as is
+                label = first_label
+                break
+            seen.add(label)
+        if label != first_label:
+            code.set_operand(insn_idx, 0, label)
+            changed = True
+    return changed
+
+def jumps_to_next(code, removed):
+    changed = False
+    for insn_idx, op in enumerate(code.ops):
+        if (op == JUMP or op == JMPZ) and code.labels[code.operand(insn_idx, 0)[1]] == insn_idx + 1:
+            removed.add(insn_idx)
+            changed = True
+    return changed
@@ -0,0 +1,222 @@
+from array import array
+from bisect import bisect_left
+
+#opcodes, the index of the name in OPCODES is the opcode number
+OPCODES = (
+    'IASN', 'IPRT', 'IINP', 'IEQL', 'INQL', 'ILSS', 'IGRT', 'IADD', 'ISUB', 'IMLT', 'IDIV',
+    'RASN', 'RPRT', 'RINP', 'REQL', 'RNQL', 'RLSS', 'RGRT', 'RADD', 'RSUB', 'RMLT', 'RDIV',
+    'ITOR', 'RTOI',
+    'JUMP', 'JMPZ', 'HALT',
+)
+OPCODE_IDS = {name: op for op, name in enumerate(OPCODES)}
+
+#number of operands of every opcode
+ARITY = tuple(
+    0 if name == 'HALT'
+    else 1 if name in ('IPRT', 'RPRT', 'IINP', 'RINP', 'JUMP')
+    else 2 if name in ('IASN', 'RASN', 'ITOR', 'RTOI', 'JMPZ')
+    else 3
+    for name in OPCODES
+)
+
+JUMP = OPCODE_IDS['JUMP']
+JMPZ = OPCODE_IDS['JMPZ']
+HALT = OPCODE_IDS['HALT']
+
+#opcodes that assign a value to their first operand
+ASSIGNING_OPS = frozenset(
+    op for op, name in enumerate(OPCODES) if name not in ('IPRT', 'RPRT', 'JUMP', 'JMPZ', 'HALT')
+)
+
+#the indices of the operands that every opcode reads
+USED_OPERANDS = tuple(
+    () if name in ('IINP', 'RINP', 'JUMP', 'HALT')
+    else (0,) if name in ('IPRT', 'RPRT')
+    else (1,) if name == 'JMPZ'
+    else tuple(range(1, ARITY[op]))
+    for op, name in enumerate(OPCODES)
+)
+
+#the indices of the operands that may be a number, tools/qx.py reads the JMPZ condition only from a name
+NUMBER_OPERANDS = tuple(() if name == 'JMPZ' else USED_OPERANDS[op] for op, name in enumerate(OPCODES))
+
+#every instruction has room for MAX_OPERANDS operands
+MAX_OPERANDS = 3
+
+#operand kinds
+OPERAND_NONE = 0
+OPERAND_ID = 1
+OPERAND_TEMP = 2
+OPERAND_NUMBER = 3
+OPERAND_LABEL = 4
+
+class QuadCode:
+    """
+    The generated quad code, kept as parallel arrays instead of text.
+
+    Instruction i has the opcode ops[i], and its operands are the pairs
+    (kinds[j], values[j]) for j in MAX_OPERANDS * i .. MAX_OPERANDS * i + MAX_OPERANDS - 1.
+    The value of an operand depends on its kind:
+        OPERAND_ID - index in names
+        OPERAND_TEMP - index in temps
+        OPERAND_NUMBER - index in consts
+        OPERAND_LABEL - index in labels
+    Labels stay symbolic, they are resolved to line numbers only when the code is formatted.
+    """
+    def __init__(self):
+        self.ops = array('B')
+        self.kinds = array('B')
+        self.values = array('i')
+        #ID index -> name
+        self.names = []
+        self.names_ids = {}
+        #const index -> int/float value
+        self.consts = []
+        self.consts_ids = {}
+        #temp index -> 'int'/'float'
+        self.temps = []
+        #label index -> index of the instruction the label points to, -1 if not placed yet
+        self.labels = array('i')
+
+    def __len__(self):
+        return len(self.ops)
+
+    def id_operand(self, name):
+        name_id = self.names_ids.get(name)
+        if name_id is None:
+            name_id = self.names_ids[name] = len(self.names)
+            self.names.append(name)
+        return (OPERAND_ID, name_id)
+
+    def number_operand(self, value):
+        #the type is part of the key since 1 == 1.0, and the repr since 0.0 == -0.0
+        key = (type(value), repr(value))
+        const_id = self.consts_ids.get(key)
+        if const_id is None:
+            const_id = self.consts_ids[key] = len(self.consts)
+            self.consts.append(value)
+        return (OPERAND_NUMBER, const_id)
+
+    def new_temp(self, var_type):
+        self.temps.append(var_type)
+        return len(self.temps) - 1
+
+    def new_label(self):
+        self.labels.append(-1)
+        return len(self.labels) - 1
+
+    def place_label(self, label):
+        #the next instruction will be labeled with label
+        self.labels[label] = len(self.ops)
+
+    def append(self, op, operands):
+        self.ops.append(op)
+        for kind, value in operands:
+            self.kinds.append(kind)
+            self.values.append(value)
+        for _ in range(MAX_OPERANDS - len(operands)):
+            self.kinds.append(OPERAND_NONE)
+            self.values.append(0)
+
+    def set_insn(self, insn_idx, op, operands):
+        self.ops[insn_idx] = op
+        slot = insn_idx * MAX_OPERANDS
+        for kind, value in operands:
+            self.kinds[slot] = kind
+            self.values[slot] = value
+            slot += 1
+        for slot in range(slot, insn_idx * MAX_OPERANDS + MAX_OPERANDS):
+            self.kinds[slot] = OPERAND_NONE
+            self.values[slot] = 0
+
+    def set_operand(self, insn_idx, operand_idx, operand):
+        slot = insn_idx * MAX_OPERANDS + operand_idx
+        self.kinds[slot], self.values[slot] = operand
+
+    def remove(self, removed):
+        """
+        Delete the instructions whose indices are in removed.
+        A label of a deleted instruction moves to the next instruction that is kept
+        """
+        if not removed:
+            return
+        removed = sorted(removed)
+        ops = array('B')
+        kinds = array('B')
+        values = array('i')
+        #copy the runs of kept instructions between the removed ones
+        run_start = 0
+        for run_end in removed + [len(self.ops)]:
+            ops.extend(self.ops[run_start:run_end])
+            kinds.extend(self.kinds[run_start * MAX_OPERANDS:run_end * MAX_OPERANDS])
+            values.extend(self.values[run_start * MAX_OPERANDS:run_end * MAX_OPERANDS])
+            run_start = run_end + 1
+        for label, insn_idx in enumerate(self.labels):
+            if insn_idx >= 0:
+                #every removed instruction before the label moves it one instruction back
+                self.labels[label] = insn_idx - bisect_left(removed, insn_idx)
+        self.ops = ops
+        self.kinds = kinds
+        self.values = values
+
+    def insert(self, insn_idx, insns):
+        """
+        Insert the instructions insns, a list of (op, operands), before insn_idx.
+        The labels of insn_idx point to the first inserted instruction
+        """
+        tail = QuadCode()
+        for op, operands in insns:
+            tail.append(op, operands)
+        slot = insn_idx * MAX_OPERANDS
+        self.ops = self.ops[:insn_idx] + tail.ops + self.ops[insn_idx:]
+        self.kinds = self.kinds[:slot] + tail.kinds + self.kinds[slot:]
+        self.values = self.values[:slot] + tail.values + self.values[slot:]
+        for label, label_idx in enumerate(self.labels):
+            if label_idx > insn_idx:
+                self.labels[label] = label_idx + len(insns)
+
+    def const_value(self, operand):
+        return self.consts[operand[1]]
+
+    def block_leaders(self):
+        """
+        The indices of the instructions that start a basic block, in ascending order:
+        the first instruction, every label target and every instruction that follows a jump
+        """
+        leaders = {0}
+        for insn_idx in self.labels:
+            if 0 <= insn_idx < len(self.ops):
+                leaders.add(insn_idx)
+        for insn_idx, op in enumerate(self.ops):
+            if (op == JUMP or op == JMPZ or op == HALT) and insn_idx + 1 < len(self.ops):
+                leaders.add(insn_idx + 1)
+        return sorted(leaders)
+
+    def operand(self, insn_idx, operand_idx):
+        slot = insn_idx * MAX_OPERANDS + operand_idx
+        return (self.kinds[slot], self.values[slot])
+
+    def operands(self, insn_idx):
+        slot = insn_idx * MAX_OPERANDS
+        return [(self.kinds[s], self.values[s]) for s in range(slot, slot + ARITY[self.ops[insn_idx]])]
+
+    def format_operand(self, kind, value):
+        if kind == OPERAND_ID:
+            return self.names[value]
+        elif kind == OPERAND_TEMP:
+            return 't{}'.format(value)
+        elif kind == OPERAND_NUMBER:
+            return str(self.consts[value])
+        elif kind == OPERAND_LABEL:
+            return str(self.labels[value] + 1)
+        return ''
+
+    def format_insn(self, insn_idx):
+        return '{} {}'.format(
+            OPCODES[self.ops[insn_idx]],
+            ' '.join(self.format_operand(kind, value) for kind, value in self.operands(insn_idx))
+        )
+
+    def lines(self):
+        for insn_idx in range(len(self.ops)):
+            yield self.format_insn(insn_idx)
@@ -0,0 +1,177 @@
+from .quad import OPCODES, OPCODE_IDS, ASSIGNING_OPS, USED_OPERANDS, MAX_OPERANDS, JUMP, JMPZ, HALT, OPERAND_NUMBER
+from .ssa import SSAForm, Phi
+from .constant_folding import fold, is_encodable, result_type
+
+#the lattice of a version: TOP before anything is known, a constant, or BOTTOM when it is not a constant
+TOP = object()
+BOTTOM = object()
+
+def same_constant(a, b):
+    #the type and the repr tell 1 from 1.0 and 0.0 from -0.0
+    return type(a) is type(b) and repr(a) == repr(b)
+
+def meet(a, b):
+    if a is TOP:
+        return b
+    if b is TOP or a is b:
+        return a
+    if a is BOTTOM or b is BOTTOM or not same_constant(a, b):
+        return BOTTOM
+    return a
+
+class SCCP:
+    """
+    Sparse conditional constant propagation (Wegman and Zadeck) over the SSA form of code:
+    finds the versions that are constant, and the blocks that can run given these constants
+    """
+    def __init__(self, code):
+        self.code = code
+        self.ssa = SSAForm(code)
+        self.cfg = self.ssa.cfg
+        #the variables that are read before they are assigned are not known
+        self.values = [BOTTOM if type(definition) is tuple else TOP for definition in self.ssa.version_defs]
+        self.block_of = [0] * len(code)
+        for block in self.cfg.blocks:
+            for insn_idx in range(block.start, block.end):
+                self.block_of[insn_idx] = block.index
+        self.executable_edges = set()
+        self.executable_blocks = set()
+        self.flow_work = []
+        self.ssa_work = []
+        self.solve()
+
+    def solve(self):
+        if not self.cfg.blocks:
+            return
+        self.flow_work.append((None, 0))
+        while self.flow_work or self.ssa_work:
+            while self.flow_work:
+                edge = self.flow_work.pop()
+                if edge in self.executable_edges:
+                    continue
+                self.executable_edges.add(edge)
+                index = edge[1]
+                for phi in self.ssa.phis[index]:
+                    self.visit_phi(phi)
+                if index not in self.executable_blocks:
+                    self.executable_blocks.add(index)
+                    block = self.cfg.blocks[index]
+                    for insn_idx in range(block.start, block.end):
+                        self.visit_insn(insn_idx)
+                    self.visit_block_end(block)
+            while self.ssa_work:
+                version = self.ssa_work.pop()
+                for use in self.ssa.version_uses[version]:
+                    if type(use) is Phi:
+                        if use.block in self.executable_blocks:
+                            self.visit_phi(use)
+                    elif self.block_of[use] in self.executable_blocks:
+                        self.visit_insn(use)
+                        if self.code.ops[use] == JMPZ:
+                            self.visit_block_end(self.cfg.blocks[self.block_of[use]])
+
+    def set_value(self, version, value):
+        old_value = self.values[version]
+        if old_value is BOTTOM or old_value is value or \
+                old_value is not TOP and value is not TOP and value is not BOTTOM and same_constant(old_value, value):
+            return
+        self.values[version] = value
+        self.ssa_work.append(version)
+
+    def operand_value(self, insn_idx, operand_idx):
+        operand = self.code.operand(insn_idx, operand_idx)
+        if operand[0] == OPERAND_NUMBER:
+            return self.code.const_value(operand)
+        return self.values[self.ssa.use_versions[insn_idx * MAX_OPERANDS + operand_idx]]
+
+    def visit_phi(self, phi):
+        value = TOP
+        for pred, version in phi.args.items():
+            if (pred, phi.block) in self.executable_edges:
+                value = meet(value, self.values[version])
+        self.set_value(phi.version, value)
+
+    def visit_insn(self, insn_idx):
+        op = self.code.ops[insn_idx]
+        if op not in ASSIGNING_OPS:
+            return
+        insn = OPCODES[op]
+        values = [self.operand_value(insn_idx, operand_idx) for operand_idx in USED_OPERANDS[op]]
+        if insn in ('IINP', 'RINP') or any(value is BOTTOM for value in values):
+            value = BOTTOM
+        elif any(value is TOP for value in values):
+            value = TOP
+        elif insn in ('IASN', 'RASN'):
+            value = values[0]
+        else:
+            value = fold(insn, values, encodable_only=False)
+            if value is None:
+                value = BOTTOM
+        self.set_value(self.ssa.def_versions[insn_idx], value)
+
+    def visit_block_end(self, block):
+        code = self.code
+        last_idx = block.end - 1
+        op = code.ops[last_idx]
+        if op == HALT:
+            return
+        if op == JUMP or op == JMPZ:
+            target = code.labels[code.operand(last_idx, 0)[1]]
+        if op == JMPZ:
+            condition = self.operand_value(last_idx, 1)
+            if condition is TOP:
+                return
+            if condition is BOTTOM or condition == 0:
+                self.flow_work.append((block.index, self.cfg.block_at[target].index))
+            if condition is BOTTOM or condition != 0:
+                self.flow_work.append((block.index, self.cfg.block_at[block.end].index))
+        elif op == JUMP:
+            self.flow_work.append((block.index, self.cfg.block_at[target].index))
+        elif block.end < len(code):
+            self.flow_work.append((block.index, self.cfg.block_at[block.end].index))
+
+    def constant(self, value):
+        """
+        @returns value if it is a constant that can be written in the quad code, or None
+        """
+        if value is TOP or value is BOTTOM or not is_encodable(value):
+            return None
+        return value
+
+def propagate_constants(code):
+    """
+    Sparse conditional constant propagation: replace the operands that are always the same constant with it,
+    turn a JMPZ on a constant to a JUMP or remove it, and remove the blocks that can never run
+    (the final HALT is kept, tools/qx.py requires it)
+    @returns the number of removed instructions
+    """
+    sccp = SCCP(code)
+    removed = set()
+    for block in sccp.cfg.blocks:
+        if block.index not in sccp.executable_blocks:
+            removed.update(range(block.start, block.end))
+            continue
+        for insn_idx in range(block.start, block.end):
+            op = code.ops[insn_idx]
+            for operand_idx in USED_OPERANDS[op]:
+                if code.operand(insn_idx, operand_idx)[0] == OPERAND_NUMBER:
+                    continue
+                value = sccp.operand_value(insn_idx, operand_idx)
+                if op == JMPZ:
+                    #the branch that is never taken was not marked executable, even on a value with no literal
+                    if value is not TOP and value is not BOTTOM:
+                        if value == 0:
+                            code.set_insn(insn_idx, JUMP, [code.operand(insn_idx, 0)])
+                        else:
+                            removed.add(insn_idx)
+                elif sccp.constant(value) is not None:
+                    code.set_operand(insn_idx, operand_idx, code.number_operand(value))
+            if op in ASSIGNING_OPS and OPCODES[op] not in ('IASN', 'RASN'):
+                value = sccp.constant(sccp.values[sccp.ssa.def_versions[insn_idx]])
+                if value is not None:
+                    asn = 'IASN' if result_type(OPCODES[op]) == 'int' else 'RASN'
+                    code.set_insn(insn_idx, OPCODE_IDS[asn], [code.operand(insn_idx, 0), code.number_operand(value)])
+    if len(code) and code.ops[len(code) - 1] == HALT:
+        removed.discard(len(code) - 1)
+    code.remove(removed)
+    return len(removed)
@@ -0,0 +1,172 @@
+from .quad import OPCODES, OPCODE_IDS, OPERAND_TEMP, OPERAND_NUMBER
+from .licm import transform_loops, can_insert_preheader, insert_preheader, assigned_before_loop
+from . import liveness
+
+IADD = OPCODE_IDS['IADD']
+ISUB = OPCODE_IDS['ISUB']
+IMLT = OPCODE_IDS['IMLT']
+IASN = OPCODE_IDS['IASN']
+
+def is_number(code, operand, value):
+    """
+    Checks if operand is the constant value, of the same type (1 is not 1.0)
+    """
+    if operand[0] != OPERAND_NUMBER:
+        return False
+    const = code.const_value(operand)
+    return type(const) is type(value) and const == value
+
+def simplified(code, insn, a, b):
+    """
+    The algebraic identities of a op b.
+    Float identities are used only when they give the same result for every float,
+    so x + 0.0 stays (it turns -0.0 to 0.0) and so does x * 0.0 (inf and nan)
+    @returns (instruction name, operands without the destination) to compute instead, or None
+    """
+    if insn == 'IADD':
+        if is_number(code, b, 0):
+            return ('IASN', [a])
+        if is_number(code, a, 0):
+            return ('IASN', [b])
+    elif insn == 'ISUB':
+        if is_number(code, b, 0):
+            return ('IASN', [a])
+        if a == b:
+            return ('IASN', [code.number_operand(0)])
+    elif insn == 'IMLT':
+        for x, y in ((a, b), (b, a)):
+            if is_number(code, y, 1):
+                return ('IASN', [x])
+            if is_number(code, y, 0):
+                return ('IASN', [y])
+            if is_number(code, y, 2):
+                #tools/qx.py runs an IADD as fast as an IMLT, but adding is cheaper on big integers
+                return ('IADD', [x, x])
+    elif insn == 'IDIV':
+        if is_number(code, b, 1):
+            return ('IASN', [a])
+    elif insn in ('IEQL', 'INQL', 'ILSS', 'IGRT'):
+        if a == b:
+            return ('IASN', [code.number_operand(int(insn == 'IEQL'))])
+    elif insn == 'RSUB':
+        if is_number(code, b, 0.0):
+            return ('RASN', [a])
+    elif insn == 'RMLT':
+        for x, y in ((a, b), (b, a)):
+            if is_number(code, y, 1.0):
+                return ('RASN', [x])
+            if is_number(code, y, 2.0):
+                #exact for every float, as the multiplication is
+                return ('RADD', [x, x])
+    elif insn == 'RDIV':
+        if is_number(code, b, 1.0):
+            return ('RASN', [a])
+    return None
+
+def simplify(code):
+    """
+    Rewrite the instructions that have a cheaper equal form, e.g. IMLT x 1 to IASN x and IMLT x 2 to IADD x x.
+    Copies to the same operand they copy are removed
+    @returns the number of removed instructions
+    """
+    removed = set()
+    for insn_idx in range(len(code)):
+        insn = OPCODES[code.ops[insn_idx]]
+        operands = code.operands(insn_idx)
+        if len(operands) == 3:
+            simpler = simplified(code, insn, operands[1], operands[2])
+            if simpler is not None:
+                insn, sources = simpler
+                operands = [operands[0]] + sources
+                code.set_insn(insn_idx, OPCODE_IDS[insn], operands)
+        if insn in ('IASN', 'RASN') and operands[0] == operands[1]:
+            removed.add(insn_idx)
+    code.remove(removed)
+    return len(removed)
+
+def induction_step(code, block, def_idx, var):
+    """
+    Checks if def_idx adds a constant to var: IADD var var c, or IADD t var c followed by IASN var t
+    @returns the step (negative for ISUB), or None
+    """
+    op = code.ops[def_idx]
+    if op == IASN and def_idx > block.start:
+        source = code.operand(def_idx, 1)
+        def_idx -= 1
+        op = code.ops[def_idx]
+        if source == var or code.operand(def_idx, 0) != source:
+            return None
+    elif code.operand(def_idx, 0) != var:
+        return None
+    if op not in (IADD, ISUB):
+        return None
+    _, a, b = code.operands(def_idx)
+    if op == IADD and a != var:
+        a, b = b, a
+    if a != var or b[0] != OPERAND_NUMBER or type(code.const_value(b)) is not int:
+        return None
+    return code.const_value(b) if op == IADD else -code.const_value(b)
+
+def reduce_induction_variables(code):
+    """
+    Induction variable strength reduction: in a loop where an int variable i only changes by adding a constant c,
+    IMLT d i k (with a constant k) becomes IASN d r, where r is a new temp that is set to i * k before the loop
+    and increased by c * k right after i changes.
+    In tools/qx.py this exchanges a multiplication for an addition, it is worth it for big integers
+    @returns the number of reduced multiplications
+    """
+    return transform_loops(code, reduce_loop)
+
+def reduce_loop(code, loop_round, header, body):
+    if not can_insert_preheader(code, header, body):
+        return 0
+    assigned_on_entry = assigned_before_loop(loop_round.assigned_outs, header, body)
+    blocks = sorted((loop_round.cfg.blocks[index] for index in body), key=lambda block: block.start)
+    #operand -> (block, instruction) of the assignments in the loop
+    loop_defs = {}
+    for block in blocks:
+        for insn_idx in range(block.start, block.end):
+            for operand in liveness.defs(code, insn_idx):
+                loop_defs.setdefault(operand, []).append((block, insn_idx))
+
+    #induction variable -> (instruction that changes it, step)
+    induction_vars = {}
+    for var, defs in loop_defs.items():
+        if len(defs) != 1 or var not in assigned_on_entry:
+            continue
+        block, def_idx = defs[0]
+        #the update of r is put right after def_idx, in the same block
+        if def_idx == block.end - 1:
+            continue
+        step = induction_step(code, block, def_idx, var)
+        if step is not None:
+            induction_vars[var] = (def_idx, step)
+
+    #(induction variable, factor operand) -> temp
+    reduced_temps = {}
+    reduced = []
+    for block in blocks:
+        for insn_idx in range(block.start, block.end):
+            if code.ops[insn_idx] != IMLT:
+                continue
+            dest, a, b = code.operands(insn_idx)
+            if a not in induction_vars:
+                a, b = b, a
+            if a not in induction_vars or b[0] != OPERAND_NUMBER or type(code.const_value(b)) is not int:
+                continue
+            if (a, b) not in reduced_temps:
+                reduced_temps[(a, b)] = (OPERAND_TEMP, code.new_temp('int'))
+            reduced.append((insn_idx, dest, reduced_temps[(a, b)]))
+    if not reduced:
+        return 0
+
+    for insn_idx, dest, temp in reduced:
+        code.set_insn(insn_idx, IASN, [dest, temp])
+    preheader = [(IMLT, [temp, var, factor]) for (var, factor), temp in reduced_temps.items()]
+    insert_preheader(code, loop_round, header, body, preheader)
+    for (var, factor), temp in reduced_temps.items():
+        def_idx, step = induction_vars[var]
+        delta = step * code.const_value(factor)
+        op = IADD if delta >= 0 else ISUB
+        loop_round.insert(def_idx + 1, [(op, [temp, temp, code.number_operand(abs(delta))])])
+    return len(reduced)
@@ -0,0 +1,150 @@
+"""
+SSA form of a QuadCode, kept next to the code instead of rewriting it.
+
+Every assignment, every phi and every operand that is read before it is assigned at the start
+of the program defines a new version. The version that every read operand sees is recorded,
+so an analysis on the SSA form can write its results straight back to the quad code,
+and leaving SSA needs no copies.
+"""
+from .quad import ASSIGNING_OPS, USED_OPERANDS, MAX_OPERANDS, OPERAND_ID, OPERAND_TEMP
+from .cfg import CFG, immediate_dominators
+
+class Phi:
+    __slots__ = ('block', 'var', 'version', 'args')
+
+    def __init__(self, block, var):
+        #the index of the block that starts with the phi
+        self.block = block
+        self.var = var
+        self.version = None
+        #predecessor block index (None for the start of the program) -> version
+        self.args = {}
+
+    def __repr__(self):
+        return 'Phi({}, {}, {})'.format(self.block, self.var, self.args)
+
+def dominance_frontiers(cfg, idom):
+    """
+    @returns a list with the set of the dominance frontier block indices of every block
+    """
+    frontiers = [set() for _ in cfg.blocks]
+    for block in cfg.blocks:
+        preds = [pred.index for pred in block.preds if pred.index == 0 or idom[pred.index] is not None]
+        if len(preds) < 2:
+            continue
+        for pred in preds:
+            runner = pred
+            while runner != idom[block.index] and runner is not None:
+                frontiers[runner].add(block.index)
+                runner = idom[runner]
+    return frontiers
+
+class SSAForm:
+    """
+    The SSA form of code, for the blocks that can be reached from the start:
+        phis - a list with the phis at the start of every block
+        use_versions - the version of every read operand slot (insn_idx * MAX_OPERANDS + operand_idx), -1 if none
+        def_versions - the version that every instruction assigns, -1 if none
+        version_defs - the definition of every version: an instruction index, a Phi,
+                       or the operand itself for the versions at the start of the program
+        version_uses - the instruction indices and the phis that read every version
+    """
+    def __init__(self, code, cfg=None, idom=None):
+        self.code = code
+        self.cfg = cfg if cfg is not None else CFG(code)
+        self.idom = idom if idom is not None else immediate_dominators(self.cfg)
+        self.phis = [[] for _ in self.cfg.blocks]
+        self.use_versions = [-1] * (len(code) * MAX_OPERANDS)
+        self.def_versions = [-1] * len(code)
+        self.version_defs = []
+        self.version_uses = []
+        #operand -> its version at the start of the program
+        self.entry_versions = {}
+        self.place_phis()
+        self.rename()
+
+    def new_version(self, definition):
+        self.version_defs.append(definition)
+        self.version_uses.append([])
+        return len(self.version_defs) - 1
+
+    def entry_version(self, var):
+        version = self.entry_versions.get(var)
+        if version is None:
+            version = self.entry_versions[var] = self.new_version(var)
+        return version
+
+    def place_phis(self):
+        code = self.code
+        reachable = [block for block in self.cfg.blocks if block.index == 0 or self.idom[block.index] is not None]
+        #operand -> the indices of the blocks that assign it
+        def_blocks = {}
+        for block in reachable:
+            for insn_idx in range(block.start, block.end):
+                if code.ops[insn_idx] in ASSIGNING_OPS:
+                    def_blocks.setdefault(code.operand(insn_idx, 0), set()).add(block.index)
+        frontiers = dominance_frontiers(self.cfg, self.idom)
+        for var, blocks in def_blocks.items():
+            has_phi = set()
+            work = list(blocks)
+            while work:
+                index = work.pop()
+                for frontier in frontiers[index]:
+                    if frontier in has_phi:
+                        continue
+                    has_phi.add(frontier)
+                    self.phis[frontier].append(Phi(frontier, var))
+                    if frontier not in blocks:
+                        work.append(frontier)
+
+    def rename(self):
+        code = self.code
+        if not self.cfg.blocks:
+            return
+        children = [[] for _ in self.cfg.blocks]
+        for index, parent in enumerate(self.idom):
+            if parent is not None:
+                children[parent].append(index)
+        for phi in self.phis[0]:
+            phi.args[None] = self.entry_version(phi.var)
+            self.version_uses[phi.args[None]].append(phi)
+
+        #operand -> stack of its versions along the dominator tree
+        stacks = {}
+        #(block index, None) visits the block, (block index, operands) pops the versions it pushed
+        work = [(0, None)]
+        while work:
+            index, pushed = work.pop()
+            if pushed is not None:
+                for var in pushed:
+                    stacks[var].pop()
+                continue
+            block = self.cfg.blocks[index]
+            pushed = []
+            for phi in self.phis[index]:
+                phi.version = self.new_version(phi)
+                stacks.setdefault(phi.var, []).append(phi.version)
+                pushed.append(phi.var)
+            for insn_idx in range(block.start, block.end):
+                op = code.ops[insn_idx]
+                for operand_idx in USED_OPERANDS[op]:
+                    operand = code.operand(insn_idx, operand_idx)
+                    if operand[0] != OPERAND_ID and operand[0] != OPERAND_TEMP:
+                        continue
+                    versions = stacks.get(operand)
+                    version = versions[-1] if versions else self.entry_version(operand)
+                    self.use_versions[insn_idx * MAX_OPERANDS + operand_idx] = version
+                    self.version_uses[version].append(insn_idx)
+                if op in ASSIGNING_OPS:
+                    var = code.operand(insn_idx, 0)
+                    version = self.def_versions[insn_idx] = self.new_version(insn_idx)
+                    stacks.setdefault(var, []).append(version)
+                    pushed.append(var)
+            for succ in block.succs:
+                for phi in self.phis[succ.index]:
+                    versions = stacks.get(phi.var)
+                    version = versions[-1] if versions else self.entry_version(phi.var)
+                    phi.args[index] = version
+                    self.version_uses[version].append(phi)
+            work.append((index, pushed))
+            work.extend((child, None) for child in reversed(children[index]))
@@ -0,0 +1,68 @@
+from .quad import OPCODES, OPERAND_TEMP
+from .cfg import CFG
+from . import liveness
+
+def allocate_temps(code):
+    """
+    Rename the temps of code to as few temps as possible: two temps share a name
+    if they are never live at the same time and have the same type
+    (tools/qx.py binds a name to the type of its first assignment).
+    Copies that become ASN tN tN are removed
+    @returns the number of removed instructions
+    """
+    cfg = CFG(code)
+    live_outs = liveness.live_out(cfg)
+
+    #temp index -> the temps that are live while it is assigned
+    interference = {}
+    for block in cfg.blocks:
+        live = set(live_outs[block.index])
+        for insn_idx in range(block.end - 1, block.start - 1, -1):
+            for kind, temp in liveness.defs(code, insn_idx):
+                if kind == OPERAND_TEMP:
+                    interference.setdefault(temp, set()).update(
+                        value for kind, value in live if kind == OPERAND_TEMP and value != temp
+                    )
+            for kind, temp in liveness.uses(code, insn_idx):
+                if kind == OPERAND_TEMP:
+                    interference.setdefault(temp, set())
+            liveness.transfer(code, insn_idx, live)
+        if block.index == 0:
+            #temps that are read before they are assigned are all alive at the start
+            entry_temps = {value for kind, value in live if kind == OPERAND_TEMP}
+            for temp in entry_temps:
+                interference[temp].update(entry_temps - {temp})
+    for temp, neighbors in list(interference.items()):
+        for neighbor in neighbors:
+            interference[neighbor].add(temp)
+
+    #greedy coloring, a color is a name in the temps of the same type
+    colors = {}
+    new_temps = []
+    new_index = {}
+    for temp in sorted(interference):
+        temp_type = code.temps[temp]
+        used_colors = {
+            colors[neighbor] for neighbor in interference[temp]
+            if neighbor in colors and code.temps[neighbor] == temp_type
+        }
+        color = 0
+        while color in used_colors:
+            color += 1
+        colors[temp] = color
+        if (temp_type, color) not in new_index:
+            new_index[(temp_type, color)] = len(new_temps)
+            new_temps.append(temp_type)
+
+    for slot, kind in enumerate(code.kinds):
+        if kind == OPERAND_TEMP:
+            temp = code.values[slot]
+            code.values[slot] = new_index[(code.temps[temp], colors[temp])]
+    code.temps = new_temps
+
+    removed = set()
+    for insn_idx, op in enumerate(code.ops):
+        if OPCODES[op] in ('IASN', 'RASN') and code.operand(insn_idx, 0) == code.operand(insn_idx, 1):
+            removed.add(insn_idx)
+    code.remove(removed)
+    return len(removed)
@@ -0,0 +1,174 @@
+from .quad import OPCODES, OPCODE_IDS, ASSIGNING_OPS, USED_OPERANDS, OPERAND_NUMBER
+from .cfg import CFG, immediate_dominators
+from .constant_folding import result_type
+from . import liveness
+
+#instructions whose operands can be swapped
+COMMUTATIVE_INSNS = frozenset(('IEQL', 'INQL', 'IADD', 'IMLT', 'REQL', 'RNQL', 'RADD', 'RMLT'))
+
+MISSING = object()
+
+class ValueTable:
+    """
+    The value numbers known at some point of the code.
+    Every change is logged so the table can go back to an earlier state,
+    which is how a block of the dominator tree hands its table to the blocks it dominates
+    """
+    def __init__(self):
+        #operand -> value number of the value it holds
+        self.numbers = {}
+        #(opcode, value numbers of the operands) -> value number of the result
+        self.exprs = {}
+        #value number -> the operands that were assigned that value, some may hold another value by now,
+        #as a linked list (operand, rest) from the last one, so adding one is cheap to do and to undo
+        self.holders = {}
+        self.next_number = 0
+        self.log = []
+
+    def set(self, table, key, value):
+        self.log.append((table, key, table.get(key, MISSING)))
+        table[key] = value
+
+    def undo(self, mark):
+        while len(self.log) > mark:
+            table, key, old_value = self.log.pop()
+            if old_value is MISSING:
+                del table[key]
+            else:
+                table[key] = old_value
+
+    def new_number(self):
+        self.next_number += 1
+        return self.next_number
+
+    def number(self, operand):
+        number = self.numbers.get(operand)
+        if number is None:
+            number = self.new_number()
+            self.assign(operand, number)
+        return number
+
+    def assign(self, operand, number):
+        self.set(self.numbers, operand, number)
+        self.set(self.holders, number, (operand, self.holders.get(number)))
+
+    def kill(self, operand):
+        if operand in self.numbers:
+            self.set(self.numbers, operand, self.new_number())
+
+    def holder(self, number, preferred):
+        """
+        @returns an operand that holds the value number now, preferred if it does, or None
+        """
+        if self.numbers.get(preferred) == number:
+            return preferred
+        link = self.holders.get(number)
+        while link is not None:
+            operand, link = link
+            if self.numbers.get(operand) == number:
+                return operand
+        return None
+
+def number_values(code, across_blocks=True):
+    """
+    Value numbering: an instruction that computes a value that is already held by a variable or temp
+    becomes a copy of it, and is removed if its destination already holds it.
+    With across_blocks, a block starts with the values of its immediate dominator, without the variables
+    that may be assigned on the way from the dominator (so the same comparison in two ifs is computed once)
+    @returns the number of removed instructions
+    """
+    cfg = CFG(code)
+    if not cfg.blocks:
+        return 0
+    idom = immediate_dominators(cfg)
+    table = ValueTable()
+    removed = set()
+    if not across_blocks:
+        for block in cfg.blocks:
+            mark = len(table.log)
+            number_block(code, block, table, removed)
+            table.undo(mark)
+        code.remove(removed)
+        return len(removed)
+
+    block_defs = [
+        {operand for insn_idx in range(block.start, block.end) for operand in liveness.defs(code, insn_idx)}
+        for block in cfg.blocks
+    ]
+    children = [[] for _ in cfg.blocks]
+    for block in cfg.blocks:
+        if idom[block.index] is not None:
+            children[idom[block.index]].append(block.index)
+
+    #(block index, None) visits the block, (block index, mark) returns to the table of its dominator
+    stack = [(0, None)]
+    while stack:
+        index, mark = stack.pop()
+        if mark is not None:
+            table.undo(mark)
+            continue
+        stack.append((index, len(table.log)))
+        block = cfg.blocks[index]
+        if index != 0:
+            for operand in assigned_between(cfg, idom[index], block, block_defs):
+                table.kill(operand)
+        number_block(code, block, table, removed)
+        for child in reversed(children[index]):
+            stack.append((child, None))
+    code.remove(removed)
+    return len(removed)
+
+def assigned_between(cfg, dominator, block, block_defs):
+    """
+    The operands that may be assigned after the end of the dominator block and before block starts
+    """
+    assigned = set()
+    seen = set()
+    stack = list(block.preds)
+    while stack:
+        pred = stack.pop()
+        if pred.index == dominator or pred.index in seen:
+            continue
+        seen.add(pred.index)
+        assigned |= block_defs[pred.index]
+        stack.extend(pred.preds)
+    return assigned
+
+def number_block(code, block, table, removed):
+    for insn_idx in range(block.start, block.end):
+        op = code.ops[insn_idx]
+        if op not in ASSIGNING_OPS:
+            continue
+        insn = OPCODES[op]
+        dest = code.operand(insn_idx, 0)
+        if insn in ('IINP', 'RINP'):
+            table.kill(dest)
+            continue
+        sources = [code.operand(insn_idx, operand_idx) for operand_idx in USED_OPERANDS[op]]
+        for source in sources:
+            if source[0] == OPERAND_NUMBER and source not in table.numbers:
+                #a constant always holds its own value
+                table.assign(source, table.new_number())
+        numbers = [table.number(source) for source in sources]
+
+        if insn in ('IASN', 'RASN'):
+            number = numbers[0]
+        else:
+            if insn in COMMUTATIVE_INSNS:
+                numbers.sort()
+            key = (op,) + tuple(numbers)
+            number = table.exprs.get(key)
+            holder = table.holder(number, dest) if number is not None else None
+            if holder is None:
+                if number is None:
+                    number = table.new_number()
+                    table.set(table.exprs, key, number)
+            elif holder != dest:
+                asn = 'IASN' if result_type(insn) == 'int' else 'RASN'
+                code.set_insn(insn_idx, OPCODE_IDS[asn], [dest, holder])
+
+        if table.numbers.get(dest) == number:
+            #dest already holds the value
+            removed.add(insn_idx)
+            continue
+        table.assign(dest, number)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Convert quad programs between the .qud text format and binary quad bytecode."""
+
+from __future__ import print_function, division
+import sys
+import os
+import argparse
+
+from qx import QuadError, load_program
+# qx puts the compiler on the path, the binary format is defined in src/bytecode.py
+from src.bytecode import MAGIC, TAG_SYMBOL, TAG_CONST, TAG_LINE, write_insns
+from src.quad import OPCODE_IDS
+
+
+JUMP_OPS = ("JUMP", "JMPZ")
+
+
+def write_binary(program, f):
+    insns = []
+    for inst in program.code:
+        operands = []
+        for j, oper in enumerate(inst.opers):
+            if isinstance(oper, str):
+                operands.append((TAG_SYMBOL, oper))
+            elif j == 0 and inst.op in JUMP_OPS:
+                operands.append((TAG_LINE, oper))
+            else:
+                operands.append((TAG_CONST, oper))
+        insns.append((OPCODE_IDS[inst.op], operands))
+    write_insns(insns, f)
+
+
+def write_text(program, f):
+    for inst in program.code:
+        f.write("{}\n".format(inst))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source",
+                        help="a .qud text file, or a binary file written by 'cpq --binary'")
+    parser.add_argument("-o", "--output",
+                        help="output file (default: the source with a .qbc/.qud extension)")
+
+    args = parser.parse_args()
+
+    with open(args.source, "rb") as f:
+        is_binary = f.read(len(MAGIC)) == MAGIC
+
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.source)[0] + (".qud" if is_binary else ".qbc")
+
+    try:
+        program = load_program(args.source)
+    except QuadError as e:
+        print("{}:{}: error: {}".format(args.source, e.lineno, e.msg), file=sys.stderr)
+        return 1
+
+    if is_binary:
+        with open(output, "w") as f:
+            write_text(program, f)
+    else:
+        with open(output, "wb") as f:
+            write_binary(program, f)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
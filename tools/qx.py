@@ -3,9 +3,35 @@
 
 from __future__ import print_function, division
 import sys
+import os
 import io
 import re
+import json
+import math
+import random
+import timeit
+import struct
+import signal
+import operator
 import argparse
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    # Only LaneInterpreter uses it, and it runs the lanes one at a time without it
+    numpy = None
+
+# Binary quad bytecode, as written by "cpq --binary", is read with the definition of the format in src/bytecode.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from src.bytecode import (
+    MAGIC as BINARY_MAGIC, VERSION as BINARY_VERSION, HEADER as BINARY_HEADER, INSN as BINARY_INST,
+    SYMBOL_LEN as BINARY_SYMBOL_LEN, CONST_TAG as BINARY_CONST_TAG, INT64 as BINARY_INT64,
+    FLOAT64 as BINARY_FLOAT64, BIGINT_LEN as BINARY_BIGINT_LEN,
+    TAG_NONE, TAG_LINE, CONST_INT, CONST_FLOAT, CONST_BIGINT,
+)
+# The opcode numbers of the binary format are the indices in OPCODES
+from src.quad import OPCODES as BINARY_OPS
 
 
 PY2 = sys.version_info[0] == 2
@@ -14,12 +40,52 @@ if PY2:
     input = raw_input
 
 
+# The number of values that batch output collects before writing them
+BATCH_OUTPUT_LINES = 1 << 16
+
+# The default number of runs that LaneInterpreter runs together
+LANE_COUNT = 1024
+# Lane ints are int64 while the operands of +, -, * and // are smaller than this, so they never overflow
+LANE_INT_LIMIT = 1 << 62
+
+# The default number of runs that a pool worker gets at a time
+POOL_CHUNK_SIZE = 16
+
+# The file name of the source of the functions of BlockInterpreter, in tracebacks
+BLOCKS_FILENAME = "<qx blocks>"
+
 COMMENTS_RE = re.compile(r"/\*(?:.|\n)*?\*/|#.*")
 OP_RE = re.compile(r"^[A-Z]+$")
 ID_RE = re.compile(r"^[a-z_]+[a-z0-9_]*$")
 INT_RE = re.compile(r"^[0-9]+$")
 FLOAT_RE = re.compile(r"^[0-9]+\.[0-9]*$")
 
+# The operand type of every op, by its first letter
+TYPE_PREFIXES = {"I": int, "R": float}
+
+# The operations of the binary ops, by the op without its type letter
+BINARY_OPERATIONS = {
+    "EQL": operator.eq,
+    "NQL": operator.ne,
+    "LSS": operator.lt,
+    "GRT": operator.gt,
+    "ADD": operator.add,
+    "SUB": operator.sub,
+    "MLT": operator.mul,
+}
+COMPARISON_OPS = ("EQL", "NQL", "LSS", "GRT")
+
+# The Python operators of the binary ops, for translated blocks
+BINARY_OPERATORS = {
+    "EQL": "==",
+    "NQL": "!=",
+    "LSS": "<",
+    "GRT": ">",
+    "ADD": "+",
+    "SUB": "-",
+    "MLT": "*",
+}
+
 
 class QuadError(Exception):
     def __init__(self, lineno, msg):
@@ -32,6 +98,8 @@ class QuadError(Exception):
 
 
 class QuadInst(object):
+    __slots__ = ("inst", "lineno", "op", "opers")
+
     def __init__(self, inst, lineno=None):
         self.inst = inst
         self.lineno = lineno
@@ -51,10 +119,23 @@ class QuadInst(object):
             else:
                 raise QuadError(lineno, "invalid oper: '{}'".format(oper))
 
+    @classmethod
+    def from_parts(cls, op, opers, lineno=None):
+        """Build an instruction from already decoded parts, skipping the text parsing."""
+        self = cls.__new__(cls)
+        self.op = op
+        self.opers = opers
+        self.lineno = lineno
+        # The text is only needed for tracing, so it is built on demand
+        self.inst = None
+        return self
+
     def __repr__(self):
-        return "QuadInst({!r}, {!r})".format(self.inst, self.lineno)
+        return "QuadInst({!r}, {!r})".format(str(self), self.lineno)
 
     def __str__(self):
+        if self.inst is None:
+            self.inst = " ".join([self.op] + [str(oper) for oper in self.opers])
         return self.inst
 
 
@@ -80,10 +161,105 @@ class QuadProgram(object):
         else:
             raise QuadError(lineno, "missing HALT")
 
+    @classmethod
+    def from_binary(cls, data):
+        """Load a program from binary quad bytecode."""
+        self = cls.__new__(cls)
+        self.code = []
+        view = memoryview(data)
+
+        try:
+            magic, version, num_symbols, num_consts, num_insts = BINARY_HEADER.unpack_from(view, 0)
+        except struct.error:
+            raise QuadError(0, "truncated binary header")
+        if magic != BINARY_MAGIC:
+            raise QuadError(0, "not a binary quad file")
+        if version != BINARY_VERSION:
+            raise QuadError(0, "unsupported binary version: {}".format(version))
+        offset = BINARY_HEADER.size
+
+        try:
+            symbols = []
+            for _ in range(num_symbols):
+                length, = BINARY_SYMBOL_LEN.unpack_from(view, offset)
+                offset += BINARY_SYMBOL_LEN.size
+                symbol = view[offset:offset + length].tobytes()
+                # Identifiers are str, which is bytes on Python 2
+                symbols.append(symbol if PY2 else symbol.decode("utf-8"))
+                offset += length
+
+            consts = []
+            for _ in range(num_consts):
+                tag, = BINARY_CONST_TAG.unpack_from(view, offset)
+                offset += BINARY_CONST_TAG.size
+                if tag == CONST_INT:
+                    value, = BINARY_INT64.unpack_from(view, offset)
+                    offset += BINARY_INT64.size
+                elif tag == CONST_FLOAT:
+                    value, = BINARY_FLOAT64.unpack_from(view, offset)
+                    offset += BINARY_FLOAT64.size
+                elif tag == CONST_BIGINT:
+                    length, = BINARY_BIGINT_LEN.unpack_from(view, offset)
+                    offset += BINARY_BIGINT_LEN.size
+                    value = int(view[offset:offset + length].tobytes())
+                    offset += length
+                else:
+                    raise QuadError(0, "invalid constant tag: {}".format(tag))
+                consts.append(value)
+        except struct.error:
+            raise QuadError(0, "truncated binary file")
+
+        code_end = offset + num_insts * BINARY_INST.size
+        if len(view) < code_end:
+            raise QuadError(0, "truncated binary file")
+
+        # Indexed by operand tag, TAG_NONE and TAG_LINE operands are never looked up
+        pools = (None, symbols, consts)
+
+        lineno = 0
+        # Struct.iter_unpack is Python 3 only
+        records = (BINARY_INST.unpack_from(view, record) for record in range(offset, code_end, BINARY_INST.size))
+        for lineno, (op, tag0, tag1, tag2, value0, value1, value2) in enumerate(records, 1):
+            if op >= len(BINARY_OPS):
+                raise QuadError(lineno, "invalid op: '{}'".format(op))
+
+            # Operands are packed to the front, the first TAG_NONE ends them
+            opers = []
+            try:
+                if tag0 != TAG_NONE:
+                    opers.append(value0 if tag0 == TAG_LINE else pools[tag0][value0])
+                    if tag1 != TAG_NONE:
+                        opers.append(value1 if tag1 == TAG_LINE else pools[tag1][value1])
+                        if tag2 != TAG_NONE:
+                            opers.append(value2 if tag2 == TAG_LINE else pools[tag2][value2])
+            except IndexError:
+                raise QuadError(lineno, "invalid oper in binary instruction")
+
+            inst = QuadInst.from_parts(BINARY_OPS[op], opers, lineno)
+            self.code.append(inst)
+            if inst.op == "HALT":
+                break
+        else:
+            raise QuadError(lineno, "missing HALT")
+
+        return self
+
     def __repr__(self):
         return "<QuadProgram: {} instructions>".format(len(self.code))
 
 
+def load_program(path):
+    """Load a program from a .qud text file or a binary quad bytecode file."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if data.startswith(BINARY_MAGIC):
+        return QuadProgram.from_binary(data)
+    if PY2:
+        return QuadProgram(io.BytesIO(data))
+    return QuadProgram(io.StringIO(data.decode("utf-8")))
+
+
 def is_type(value, type_):
     if PY2 and type_ is int:
         type_ = (int, long)
@@ -91,70 +267,358 @@ def is_type(value, type_):
     return isinstance(value, type_)
 
 
-class Namespace(object):
-    class Entry(object):
-        def __init__(self, lineno, value):
-            self.lineno = lineno
-            self.value = value
+# The value of a slot in the bank of a type it does not hold
+UNSET = object()
 
-        def __repr__(self):
-            return "Namespace.Entry({!r}, {!r})".format(self.lineno, self.value)
 
+class Namespace(object):
+    """
+    The variables, by slot. Every name gets a slot the first time it is seen (when the program is decoded),
+    and its value is kept in the bank of its type, ints[slot] or floats[slot], while the other bank holds UNSET.
+    A variable takes the type of its first assignment, and keeps it.
+    Constants are given slots too, with their value already in the bank of their type.
+    """
     def __init__(self):
-        self._ns = {}
+        self.slots = {}
+        self.consts = {}
+        # The name of every slot, None for constants
+        self.names = []
+        # The line of the first assignment of every slot, None until it is assigned
+        self.linenos = []
+        self.ints = []
+        self.floats = []
 
     def __repr__(self):
-        return "Namespace({!r})".format(self._ns)
+        return "Namespace({!r})".format(dict(
+            (name, self.ints[slot] if self.ints[slot] is not UNSET else self.floats[slot])
+            for name, slot in self.slots.items() if self.ints[slot] is not UNSET or self.floats[slot] is not UNSET))
 
-    def get(self, lineno, type_, name):
-        return self._lookup(lineno, type_, name).value
+    def bank(self, type_):
+        return self.ints if type_ is int else self.floats
 
-    def set(self, lineno, type_, name, value):
+    def new_slot(self, name, lineno):
+        self.names.append(name)
+        self.linenos.append(lineno)
+        self.ints.append(UNSET)
+        self.floats.append(UNSET)
+        return len(self.names) - 1
+
+    def slot(self, name):
         try:
-            self._lookup(lineno, type_, name).value = value
+            return self.slots[name]
         except KeyError:
-            self._ns[name] = self.Entry(lineno, value)
+            slot = self.slots[name] = self.new_slot(name, None)
+            return slot
 
-    def _lookup(self, lineno, type_, name):
+    def const(self, type_, value):
+        # The repr tells 0.0 from -0.0 (and matches nan)
+        key = value if type_ is int else repr(value)
+        try:
+            return self.consts[key]
+        except KeyError:
+            slot = self.consts[key] = self.new_slot(None, 0)
+            self.bank(type_)[slot] = value
+            return slot
+
+    def get(self, lineno, type_, name):
+        slot = self._lookup(lineno, name)
+        value = self.bank(type_)[slot]
+        if value is UNSET:
+            self.read_failed(lineno, type_, slot)
+        return value
+
+    def set(self, lineno, type_, name, value):
+        slot = self._lookup(lineno, name)
+        bank = self.bank(type_)
+        if bank[slot] is UNSET:
+            self.bind(lineno, type_, slot)
+        bank[slot] = value
+
+    def read_failed(self, lineno, type_, slot):
+        """Raise the error of reading a slot as type_ that is not in its bank."""
+        if self.linenos[slot] is None:
+            raise KeyError(self.names[slot])
+        self._mismatch(lineno, type_, slot)
+
+    def bind(self, lineno, type_, slot):
+        """Make sure a slot that is not in the bank of type_ can be assigned as type_: only if it is unassigned."""
+        if self.linenos[slot] is not None:
+            self._mismatch(lineno, type_, slot)
+        self.linenos[slot] = lineno
+
+    def _lookup(self, lineno, name):
         if not isinstance(name, str):
             raise QuadError(lineno, "invalid identifier '{}'".format(name))
 
-        entry = self._ns[name]
+        return self.slot(name)
+
+    def _mismatch(self, lineno, type_, slot):
+        value = self.ints[slot] if self.ints[slot] is not UNSET else self.floats[slot]
+        raise QuadError(
+            lineno,
+            "type mismatch for variable '{}' (declared at line {}), "
+            "expected {}, found {}".format(
+                self.names[slot], self.linenos[slot], type_.__name__, type(value).__name__))
+
+
+def read_tokens(path=None):
+    """Read the whitespace separated input values of batch mode, from a file or stdin."""
+    if path is None:
+        data = sys.stdin.read()
+    else:
+        with open(path) as f:
+            data = f.read()
+    return iter(data.split())
+
+
+def next_input(inputs, lineno, type_, name):
+    """The next value of the iterator of input strings inputs, as type_."""
+    try:
+        token = next(inputs)
+    except StopIteration:
+        raise QuadError(lineno, "no input left for '{}'".format(name))
+    try:
+        return type_(token)
+    except ValueError:
+        raise QuadError(lineno, "invalid input for '{}' ({}): '{}'".format(name, type_.__name__, token))
+
+
+class RunOutput(object):
+    """Keeps the printed values of a run, as strings."""
+    def __init__(self):
+        self.lines = []
+
+    def write(self, value):
+        self.lines.append(str(value))
 
-        if not is_type(entry.value, type_):
-            raise QuadError(
-                lineno,
-                "type mismatch for variable '{}' (declared at line {}), "
-                "expected {}, found {}".format(
-                    name, entry.lineno, type_.__name__, type(entry.value).__name__))
 
-        return entry
+class BatchOutput(object):
+    """Collects the printed values, and writes them together when flushed or when many have been collected."""
+    def __init__(self, stream):
+        self.stream = stream
+        self.lines = []
+
+    def write(self, value):
+        self.lines.append(str(value))
+        if len(self.lines) >= BATCH_OUTPUT_LINES:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append("")
+            self.stream.write("\n".join(self.lines))
+            self.lines = []
+        self.stream.flush()
 
 
 class QuadInterpreter(object):
-    def __init__(self, prog, trace=False):
+    def __init__(self, prog, trace=False, inputs=None, output=None):
+        """
+        inputs is an iterator of the input values as strings, None to prompt for every input.
+        The printed values are written to output (e.g. a BatchOutput), None to print them.
+        """
         self.prog = prog
         self.code = prog.code
         self.trace = trace
+        self.inputs = inputs
+        self.write = output.write if output is not None else print
         self.pc = 1
         self.ns = Namespace()
+        self.handlers = None
 
     def run(self):
-        while True:
-            if self.pc is None:
-                break
-
-            inst = self.code[self.pc - 1]
+        if self.handlers is None:
+            self.handlers = self.decode()
+        handlers = self.handlers
+        pc = self.pc
+        try:
             if self.trace:
-                print("#{} {}".format(self.pc, inst), file=sys.stderr)
-            self.pc += 1
-
-            try:
-                eval_inst = getattr(self, "eval_" + inst.op)
-            except AttributeError:
+                code = self.code
+                while pc is not None:
+                    print("#{} {}".format(pc, code[pc - 1]), file=sys.stderr)
+                    pc = handlers[pc]()
+            else:
+                while pc is not None:
+                    pc = handlers[pc]()
+        finally:
+            # The pc of the instruction that failed, if one did
+            self.pc = pc
+
+    def failed_lineno(self, tb):
+        """The line of the instruction that failed, after run raised the exception of the traceback tb."""
+        return self.code[self.pc - 1].lineno if self.pc is not None else None
+
+    def decode(self):
+        """
+        Decode every instruction to a handler that runs it and returns the next pc (None to halt),
+        with the operands and the next pc already bound. Indexed by pc.
+        """
+        handlers = [self.decode_inst(inst, pc) for pc, inst in enumerate(self.code, 1)]
+        # pc 0 runs the last instruction, like self.code[pc - 1] does
+        return handlers[-1:] + handlers
+
+    def decode_inst(self, inst, pc):
+        op, opers, lineno = inst.op, inst.opers, inst.lineno
+        next_pc = pc + 1
+        type_ = TYPE_PREFIXES.get(op[:1])
+        name = op[1:]
+        handler = None
+
+        if op == "HALT":
+            handler = lambda: None
+        elif op == "JUMP":
+            if opers and isinstance(opers[0], int):
+                target = opers[0]
+                handler = lambda: target
+        elif op == "JMPZ":
+            if len(opers) >= 2 and isinstance(opers[0], int) and isinstance(opers[1], str):
+                handler = self.decode_jmpz(lineno, opers[0], opers[1], next_pc)
+        elif op == "ITOR":
+            if len(opers) >= 2:
+                handler = self.decode_unary(lineno, float, opers[0], float, int, opers[1], next_pc)
+        elif op == "RTOI":
+            if len(opers) >= 2:
+                handler = self.decode_unary(lineno, int, opers[0], int, float, opers[1], next_pc)
+        elif type_ is None:
+            pass
+        elif name == "ASN":
+            if len(opers) >= 2:
+                handler = self.decode_unary(lineno, type_, opers[0], None, type_, opers[1], next_pc)
+        elif name == "PRT":
+            if opers and self.is_readable(type_, opers[0]):
+                handler = self.decode_prt(lineno, type_, opers[0], next_pc)
+        elif name == "INP":
+            if opers:
+                handler = self.decode_inp(type_, inst, next_pc)
+        elif name == "DIV" or name in BINARY_OPERATIONS:
+            if len(opers) >= 3:
+                if name == "DIV":
+                    operation = operator.floordiv if type_ is int else operator.truediv
+                else:
+                    operation = BINARY_OPERATIONS[name]
+                dest_type = int if name in COMPARISON_OPS else type_
+                handler = self.decode_binary(
+                    lineno, dest_type, opers[0], operation, type_, opers[1], opers[2], next_pc)
+
+        if handler is None:
+            handler = self.decode_generic(inst, next_pc)
+        return handler
+
+    def decode_generic(self, inst, next_pc):
+        """
+        Run an instruction through its eval_ method. Used for the instructions that fail when they run
+        (unknown ops, missing or invalid operands), so the error is raised at the same time as before.
+        """
+        eval_inst = getattr(self, "eval_" + inst.op, None)
+
+        def handler():
+            if eval_inst is None:
                 raise QuadError(inst.lineno, "unknown op: '{}'".format(inst.op))
-
+            self.pc = next_pc
             eval_inst(inst)
+            return self.pc
+
+        return handler
+
+    @staticmethod
+    def is_readable(type_, oper):
+        return isinstance(oper, str) or is_type(oper, type_)
+
+    def operand_slot(self, type_, oper):
+        """The slot of a readable operand, a variable or a constant in the bank of type_."""
+        if isinstance(oper, str):
+            return self.ns.slot(oper)
+        return self.ns.const(type_, oper)
+
+    def decode_jmpz(self, lineno, target, cond, next_pc):
+        ints, slot, read_failed = self.ns.ints, self.ns.slot(cond), self.ns.read_failed
+
+        def handler():
+            value = ints[slot]
+            if value is UNSET:
+                read_failed(lineno, int, slot)
+            if value == 0:
+                return target
+            return next_pc
+
+        return handler
+
+    def decode_prt(self, lineno, type_, oper, next_pc):
+        bank, slot, read_failed = self.ns.bank(type_), self.operand_slot(type_, oper), self.ns.read_failed
+        write = self.write
+
+        def handler():
+            value = bank[slot]
+            if value is UNSET:
+                read_failed(lineno, type_, slot)
+            write(value)
+            return next_pc
+
+        return handler
+
+    def decode_inp(self, type_, inst, next_pc):
+        do_INP = self.do_INP
+
+        def handler():
+            do_INP(type_, inst)
+            return next_pc
+
+        return handler
+
+    def decode_unary(self, lineno, dest_type, dest, operation, type_, a, next_pc):
+        """Decode dest = operation(a), a copy if operation is None. Returns None if it can not be decoded."""
+        if not isinstance(dest, str) or not self.is_readable(type_, a):
+            return None
+        ns = self.ns
+        bank, dest_bank = ns.bank(type_), ns.bank(dest_type)
+        a_slot, dest_slot = self.operand_slot(type_, a), ns.slot(dest)
+        read_failed, bind = ns.read_failed, ns.bind
+
+        if operation is None:
+            def handler():
+                value = bank[a_slot]
+                if value is UNSET:
+                    read_failed(lineno, type_, a_slot)
+                if dest_bank[dest_slot] is UNSET:
+                    bind(lineno, dest_type, dest_slot)
+                dest_bank[dest_slot] = value
+                return next_pc
+        else:
+            def handler():
+                value = bank[a_slot]
+                if value is UNSET:
+                    read_failed(lineno, type_, a_slot)
+                value = operation(value)
+                if dest_bank[dest_slot] is UNSET:
+                    bind(lineno, dest_type, dest_slot)
+                dest_bank[dest_slot] = value
+                return next_pc
+
+        return handler
+
+    def decode_binary(self, lineno, dest_type, dest, operation, type_, a, b, next_pc):
+        """Decode dest = operation(a, b). Returns None if it can not be decoded."""
+        if not isinstance(dest, str) or not self.is_readable(type_, a) or not self.is_readable(type_, b):
+            return None
+        ns = self.ns
+        bank, dest_bank = ns.bank(type_), ns.bank(dest_type)
+        a_slot, b_slot, dest_slot = self.operand_slot(type_, a), self.operand_slot(type_, b), ns.slot(dest)
+        read_failed, bind = ns.read_failed, ns.bind
+
+        def handler():
+            x = bank[a_slot]
+            if x is UNSET:
+                read_failed(lineno, type_, a_slot)
+            y = bank[b_slot]
+            if y is UNSET:
+                read_failed(lineno, type_, b_slot)
+            value = operation(x, y)
+            if dest_bank[dest_slot] is UNSET:
+                bind(lineno, dest_type, dest_slot)
+            dest_bank[dest_slot] = value
+            return next_pc
+
+        return handler
 
     def val(self, lineno, type_, oper):
         if isinstance(oper, str):
@@ -172,17 +636,20 @@ class QuadInterpreter(object):
         self.ns.set(inst.lineno, type_, inst.opers[0], self.val(inst.lineno, type_, inst.opers[1]))
 
     def do_PRT(self, type_, inst):
-        print(self.val(inst.lineno, type_, inst.opers[0]))
+        self.write(self.val(inst.lineno, type_, inst.opers[0]))
+
+    def read_input(self, lineno, type_, name):
+        if self.inputs is not None:
+            return next_input(self.inputs, lineno, type_, name)
 
-    def do_INP(self, type_, inst):
         while True:
             try:
-                value = type_(input("{} ({})? ".format(inst.opers[0], type_.__name__)))
-                break
+                return type_(input("{} ({})? ".format(name, type_.__name__)))
             except ValueError:
                 print("Invalid input!")
 
-        self.ns.set(inst.lineno, type_, inst.opers[0], value)
+    def do_INP(self, type_, inst):
+        self.ns.set(inst.lineno, type_, inst.opers[0], self.read_input(inst.lineno, type_, inst.opers[0]))
 
     def do_EQL(self, type_, inst):
         self.ns.set(
@@ -280,20 +747,922 @@ class QuadInterpreter(object):
         self.pc = None
 
 
+def inst_operands(inst):
+    """
+    The operands of a well formed instruction: (dest, dest type, [(source, source type)]),
+    with a None dest for the instructions that assign nothing, and the jump target as the source of JUMP.
+    Returns None for an instruction that is not well formed.
+    """
+    op, opers = inst.op, inst.opers
+    type_ = TYPE_PREFIXES.get(op[:1])
+    name = op[1:]
+
+    if op == "HALT":
+        return None, None, []
+    elif op == "JUMP":
+        if opers and isinstance(opers[0], int):
+            return None, None, [(opers[0], int)]
+    elif op == "JMPZ":
+        if len(opers) >= 2 and isinstance(opers[0], int) and isinstance(opers[1], str):
+            return None, None, [(opers[0], int), (opers[1], int)]
+    elif op in ("ITOR", "RTOI"):
+        if len(opers) >= 2 and isinstance(opers[0], str):
+            from_type, to_type = (int, float) if op == "ITOR" else (float, int)
+            return opers[0], to_type, [(opers[1], from_type)]
+    elif type_ is None:
+        pass
+    elif name == "ASN":
+        if len(opers) >= 2 and isinstance(opers[0], str):
+            return opers[0], type_, [(opers[1], type_)]
+    elif name == "PRT":
+        if opers:
+            return None, None, [(opers[0], type_)]
+    elif name == "INP":
+        if opers and isinstance(opers[0], str):
+            return opers[0], type_, []
+    elif name == "DIV" or name in BINARY_OPERATIONS:
+        if len(opers) >= 3 and isinstance(opers[0], str):
+            return opers[0], int if name in COMPARISON_OPS else type_, [(opers[1], type_), (opers[2], type_)]
+
+    return None
+
+
+def is_well_formed(code):
+    """
+    Whether every instruction is well formed, with its jump target in the program,
+    and every variable is assigned and read as one type only. The instructions of such a program
+    can only fail on their values (an unassigned variable, a division by zero, a failed conversion).
+    """
+    types = {}
+    for inst in code:
+        operands = inst_operands(inst)
+        if operands is None:
+            return False
+        dest, dest_type, sources = operands
+
+        if inst.op in ("JUMP", "JMPZ"):
+            if not 0 <= sources[0][0] <= len(code):
+                return False
+            sources = sources[1:]
+
+        for oper, type_ in sources + [(dest, dest_type)]:
+            if oper is None:
+                continue
+            if not isinstance(oper, str):
+                if not is_type(oper, type_):
+                    return False
+            elif types.setdefault(oper, type_) is not type_:
+                return False
+
+    return True
+
+
+class BlockInterpreter(QuadInterpreter):
+    """
+    Runs a program by translating every basic block to a Python function that returns the pc of the next block.
+    The variables of a block are its locals: loaded from the banks when first read, and stored back when it ends.
+    Programs that can fail on a type or an operand are run by QuadInterpreter instead, which reports these errors,
+    and so are programs without loops, which run every instruction once at most, so translating them does not pay.
+    """
+    # Whether every block also returns the results of its instructions, in a tuple after the next pc
+    record = False
+
+    def __init__(self, prog, inputs=None, output=None):
+        super(BlockInterpreter, self).__init__(prog, inputs=inputs, output=output)
+        self.blocks = self.translate() if self.has_loop() and is_well_formed(self.code) else None
+
+    def run(self):
+        if self.blocks is None:
+            return super(BlockInterpreter, self).run()
+
+        blocks = self.blocks
+        pc = self.pc
+        try:
+            while pc is not None:
+                pc = blocks[pc]()
+        finally:
+            self.pc = pc
+
+    def failed_lineno(self, tb):
+        if self.blocks is None:
+            return super(BlockInterpreter, self).failed_lineno(tb)
+        # The line of the source of the block that failed tells the instruction
+        lineno = None
+        while tb is not None:
+            if tb.tb_frame.f_code.co_filename == BLOCKS_FILENAME:
+                lineno = self.source_linenos[tb.tb_lineno - 1]
+            tb = tb.tb_next
+        return lineno
+
+    def has_loop(self):
+        return any(
+            inst.op in ("JUMP", "JMPZ") and inst.opers and isinstance(inst.opers[0], int) and inst.opers[0] <= pc
+            for pc, inst in enumerate(self.code, 1))
+
+    def translate(self):
+        code = self.code
+        leaders = set([1])
+        for pc, inst in enumerate(code, 1):
+            if inst.op in ("JUMP", "JMPZ"):
+                leaders.add(self.jump_target(inst.opers[0]))
+            if inst.op in ("JUMP", "JMPZ", "HALT"):
+                leaders.add(pc + 1)
+        leaders = sorted(pc for pc in leaders if pc <= len(code))
+
+        env = {
+            "ints": self.ns.ints,
+            "floats": self.ns.floats,
+            "UNSET": UNSET,
+            "read_failed": self.ns.read_failed,
+            "read_input": self.read_input,
+            "write": self.write,
+        }
+        lines = []
+        # The line of the instruction of every line of the source, None for the lines of no instruction
+        self.source_linenos = []
+        for start, end in zip(leaders, leaders[1:] + [len(code) + 1]):
+            lines.extend(self.translate_block(start, end, env, self.source_linenos))
+        exec(compile("\n".join(lines), BLOCKS_FILENAME, "exec"), env)
+
+        blocks = [None] * (len(code) + 1)
+        for start in leaders:
+            blocks[start] = env["block_{}".format(start)]
+        return blocks
+
+    def jump_target(self, target):
+        # pc 0 runs the last instruction, which is the HALT
+        return target or len(self.code)
+
+    def translate_block(self, start, end, env, source_linenos):
+        """
+        The source of the function of the block of the instructions from pc start up to end.
+        The line of the instruction of every line of the source is appended to source_linenos.
+        """
+        ns = self.ns
+        body = []
+        body_linenos = []
+        # name -> type, of the variables with a local, and of the ones to store back
+        loaded = {}
+        assigned = {}
+        # The locals that keep the result of every instruction, if recorded
+        results = []
+
+        def source(oper, type_, lineno):
+            if not isinstance(oper, str):
+                if isinstance(oper, float) and (math.isinf(oper) or math.isnan(oper)):
+                    # Has no literal
+                    const = "k{}".format(ns.const(type_, oper))
+                    env[const] = oper
+                    return const
+                return repr(oper)
+
+            if oper not in loaded:
+                loaded[oper] = type_
+                slot = ns.slot(oper)
+                body.append("v_{} = {}[{}]".format(oper, "ints" if type_ is int else "floats", slot))
+                body.append("if v_{} is UNSET: read_failed({}, {}, {})".format(oper, lineno, type_.__name__, slot))
+            return "v_" + oper
+
+        exit = str(end)
+        for inst in self.code[start - 1:end - 1]:
+            dest, dest_type, sources = inst_operands(inst)
+            op, name, lineno = inst.op, inst.op[1:], inst.lineno
+
+            if op == "HALT":
+                exit = "None"
+            elif op == "JUMP":
+                exit = str(self.jump_target(inst.opers[0]))
+            elif op == "JMPZ":
+                exit = "{} if {} == 0 else {}".format(
+                    self.jump_target(inst.opers[0]), source(inst.opers[1], int, lineno), end)
+            elif name == "PRT":
+                body.append("write({})".format(source(inst.opers[0], sources[0][1], lineno)))
+            elif name == "INP":
+                expr = "read_input({}, {}, {!r})".format(lineno, dest_type.__name__, dest)
+            elif op in ("ITOR", "RTOI"):
+                expr = "{}({})".format(dest_type.__name__, source(inst.opers[1], sources[0][1], lineno))
+            elif name == "ASN":
+                expr = source(inst.opers[1], dest_type, lineno)
+            else:
+                operator_ = BINARY_OPERATORS.get(name) or ("//" if sources[0][1] is int else "/")
+                expr = "{} {} {}".format(
+                    source(inst.opers[1], sources[0][1], lineno), operator_, source(inst.opers[2], sources[1][1], lineno))
+
+            if dest is not None:
+                if self.record:
+                    results.append("r{}".format(len(results)))
+                    expr = "{} = {}".format(results[-1], expr)
+                body.append("v_{} = {}".format(dest, expr))
+                loaded[dest] = assigned[dest] = dest_type
+            body_linenos.extend([lineno] * (len(body) - len(body_linenos)))
+
+        for name, type_ in sorted(assigned.items()):
+            body.append("{}[{}] = v_{}".format("ints" if type_ is int else "floats", ns.slot(name), name))
+        if self.record:
+            body.append("return ({}), ({})".format(exit, "".join(result + ", " for result in results)))
+        else:
+            body.append("return " + exit)
+        body_linenos.extend([None] * (len(body) - len(body_linenos)))
+        source_linenos.extend([None] + body_linenos + [None])
+        return ["def block_{}():".format(start)] + ["    " + line for line in body] + [""]
+
+
+class ProfilingInterpreter(QuadInterpreter):
+    """
+    Runs a program like QuadInterpreter, and counts how many times every instruction runs and every jump is taken.
+    A jump back to the same or an earlier pc is the back edge of a loop, which runs from its target up to the jump.
+    If sample_every is not 0, one in sample_every of the instructions that run is timed too, on average,
+    and the time of an instruction is estimated as its sampled time times sample_every.
+    The gaps between the samples are random, so a loop whose length shares a factor with sample_every
+    does not get the same instructions timed in every iteration.
+    """
+    def __init__(self, prog, inputs=None, output=None, sample_every=0):
+        super(ProfilingInterpreter, self).__init__(prog, inputs=inputs, output=output)
+        self.sample_every = sample_every
+        # Indexed by pc, like the handlers
+        self.counts = [0] * (len(self.code) + 1)
+        self.times = [0.0] * (len(self.code) + 1)
+        # (pc, next pc) -> the number of times that the instruction at pc went to another pc than pc + 1
+        self.jumps = {}
+
+    def run(self):
+        if self.handlers is None:
+            self.handlers = self.decode()
+        handlers = self.handlers
+        counts = self.counts
+        times = self.times
+        jumps = self.jumps
+        timer = timeit.default_timer
+        randint = random.randint
+        # The gaps are uniform in 1 .. 2 * sample_every - 1, sample_every on average
+        max_gap = 2 * self.sample_every - 1
+        # Counts down to the next sampled instruction, never gets to it if sample_every is 0
+        countdown = randint(1, max_gap) if self.sample_every else 0
+        pc = self.pc
+        while pc is not None:
+            counts[pc] += 1
+            if countdown == 1:
+                countdown = randint(1, max_gap)
+                start = timer()
+                next_pc = handlers[pc]()
+                times[pc] += timer() - start
+            else:
+                countdown -= 1
+                next_pc = handlers[pc]()
+            if next_pc != pc + 1 and next_pc is not None:
+                jumps[pc, next_pc] = jumps.get((pc, next_pc), 0) + 1
+            pc = next_pc
+        self.pc = pc
+
+    def profile(self):
+        """
+        The counters, as a dict that can be written as JSON:
+            instructions - the number of instructions that ran
+            insts - the pc, line, text and count of every instruction, the number of times that it was taken
+                    and not taken for a JMPZ, and its estimated seconds if sampled
+            loops - the header and end pcs of every loop, the line of its header, the number of times
+                    that its back edge was taken, and the number of instructions that ran in it, hottest first
+        """
+        last = len(self.code)
+        # pc 0 runs the last instruction
+        counts = self.counts[1:] + [0]
+        counts[last - 1] += self.counts[0]
+        times = self.times[1:] + [0.0]
+        times[last - 1] += self.times[0]
+        jumps = {}
+        taken = {}
+        for (pc, next_pc), count in self.jumps.items():
+            edge = (pc or last, next_pc or last)
+            jumps[edge] = jumps.get(edge, 0) + count
+            taken[edge[0]] = taken.get(edge[0], 0) + count
+
+        insts = []
+        for pc, inst in enumerate(self.code, 1):
+            entry = {"pc": pc, "line": inst.lineno, "inst": str(inst), "count": counts[pc - 1]}
+            if inst.op == "JMPZ":
+                # A JMPZ to pc + 1 is never seen taken, as it goes to the same pc either way
+                entry["taken"] = taken.get(pc, 0)
+                entry["not_taken"] = counts[pc - 1] - entry["taken"]
+            if self.sample_every:
+                entry["seconds"] = times[pc - 1] * self.sample_every
+            insts.append(entry)
+
+        loops = []
+        for (pc, header), count in jumps.items():
+            if header <= pc:
+                loops.append({
+                    "header": header,
+                    "end": pc,
+                    "line": self.code[header - 1].lineno,
+                    "iterations": count,
+                    "instructions": sum(counts[header - 1:pc]),
+                })
+        loops.sort(key=lambda loop: (-loop["instructions"], loop["header"]))
+
+        return {"instructions": sum(counts), "insts": insts, "loops": loops}
+
+
+def format_profile(profile):
+    """The lines of a flat text report of a profile of ProfilingInterpreter, the hottest loops and instructions first."""
+    total = profile["instructions"] or 1
+    lines = ["{} instructions".format(profile["instructions"]), "", "loops:"]
+    lines.append("{:>6} {:>6} {:>6} {:>12} {:>14} {:>7}".format(
+        "line", "header", "end", "iterations", "instructions", "%"))
+    for loop in profile["loops"]:
+        lines.append("{:>6} {:>6} {:>6} {:>12} {:>14} {:>7.2f}".format(
+            loop["line"], loop["header"], loop["end"], loop["iterations"], loop["instructions"],
+            100 * loop["instructions"] / total))
+
+    sampled = any("seconds" in entry for entry in profile["insts"])
+    lines.extend(["", "instructions:"])
+    lines.append("{:>6} {:>6} {:>12} {:>7} {:>12} {:>12}{}  {}".format(
+        "line", "pc", "count", "%", "taken", "not taken", " {:>12}".format("seconds") if sampled else "", "inst"))
+    for entry in sorted(profile["insts"], key=lambda entry: (-entry["count"], entry["pc"])):
+        if not entry["count"]:
+            break
+        lines.append("{:>6} {:>6} {:>12} {:>7.2f} {:>12} {:>12}{}  {}".format(
+            entry["line"], entry["pc"], entry["count"], 100 * entry["count"] / total,
+            entry.get("taken", ""), entry.get("not_taken", ""),
+            " {:>12.6f}".format(entry["seconds"]) if sampled else "", entry["inst"]))
+    return lines
+
+
+def write_profile(profile, path, format_):
+    """Write a profile of ProfilingInterpreter to the file at path ("-" for stderr), in format_ ("text" or "json")."""
+    if format_ == "json":
+        report = json.dumps(profile, indent=1, separators=(",", ": "), sort_keys=True) + "\n"
+    else:
+        report = "".join(line + "\n" for line in format_profile(profile))
+    if path == "-":
+        sys.stderr.write(report)
+    else:
+        with open(path, "w") as f:
+            f.write(report)
+
+
+def format_result(value):
+    """The text of a result in a dump of the ring, that never fails, so the error of the program is the one reported."""
+    try:
+        return str(value)
+    except Exception:
+        # An int over the digit limit of the conversion of ints to strings
+        if hasattr(value, "bit_length"):
+            return "(an int of {} bits)".format(value.bit_length())
+        return "(a {})".format(type(value).__name__)
+
+
+class RingTraceInterpreter(BlockInterpreter):
+    """
+    Runs a program like BlockInterpreter, and records the last blocks that ran, with the results of their instructions,
+    in a ring of a fixed size that is allocated up front, so recording costs a few stores per block.
+    A program that is run by QuadInterpreter is recorded by instruction instead.
+    The ring is dumped to stderr when the program fails, and by dump_on_signal.
+    """
+    record = True
+
+    def __init__(self, prog, size, inputs=None, output=None):
+        super(RingTraceInterpreter, self).__init__(prog, inputs=inputs, output=output)
+        # A power of 2, so the position wraps with a mask
+        size = 1 << (size - 1).bit_length()
+        self.mask = size - 1
+        # The pc of every record, and the tuple of the results of its block, or the result of its instruction
+        self.pcs = [None] * size
+        self.values = [None] * size
+        # The position of the last record
+        self.position = self.mask
+
+    def run(self):
+        if self.blocks is None:
+            return self.run_insts()
+
+        blocks = self.blocks
+        pcs = self.pcs
+        values = self.values
+        mask = self.mask
+        # A local for speed, dump_on_signal finds it in the frame of run
+        position = self.position
+        pc = self.pc
+        try:
+            while pc is not None:
+                next_pc, results = blocks[pc]()
+                # The record is written before position moves to it, so a dump always ends with a whole record
+                next_position = (position + 1) & mask
+                pcs[next_position] = pc
+                values[next_position] = results
+                position = next_position
+                pc = next_pc
+        except Exception:
+            # The results of the block that failed are lost with its locals
+            next_position = (position + 1) & mask
+            pcs[next_position] = pc
+            values[next_position] = UNSET
+            position = next_position
+            self.dump(position)
+            raise
+        finally:
+            self.position = position
+        self.pc = pc
+
+    def run_insts(self):
+        if self.handlers is None:
+            self.handlers = self.decode()
+        handlers = self.handlers
+        result_banks, result_slots = self.decode_results()
+        pcs = self.pcs
+        values = self.values
+        mask = self.mask
+        # A local for speed, dump_on_signal finds it in the frame of run_insts
+        position = self.position
+        pc = self.pc
+        try:
+            while pc is not None:
+                next_pc = handlers[pc]()
+                next_position = (position + 1) & mask
+                pcs[next_position] = pc
+                values[next_position] = result_banks[pc][result_slots[pc]]
+                position = next_position
+                pc = next_pc
+        except Exception:
+            # The instruction that failed has no result
+            next_position = (position + 1) & mask
+            pcs[next_position] = pc
+            values[next_position] = UNSET
+            position = next_position
+            self.dump(position)
+            raise
+        finally:
+            self.position = position
+        self.pc = pc
+
+    def decode_results(self):
+        """The banks and the slots that the instructions assign their results to, indexed by pc."""
+        # The instructions that assign nothing, or are not well formed, read None
+        no_result = [None]
+        banks = []
+        slots = []
+        for inst in self.code:
+            operands = inst_operands(inst)
+            if operands is None or operands[0] is None:
+                banks.append(no_result)
+                slots.append(0)
+            else:
+                dest, dest_type, _ = operands
+                banks.append(self.ns.bank(dest_type))
+                slots.append(self.ns.slot(dest))
+        # pc 0 runs the last instruction
+        return banks[-1:] + banks, slots[-1:] + slots
+
+    def records(self, position, skip=0):
+        """The (pc, result) records of the instructions in the ring, oldest first, up to position, but the skip oldest."""
+        start = position + 1
+        records = []
+        for i in (list(range(start, len(self.pcs))) + list(range(start)))[skip:]:
+            pc, value = self.pcs[i], self.values[i]
+            if pc is None:
+                continue
+            if self.blocks is None:
+                records.append((pc, value))
+                continue
+            # The results of a block are the ones of its instructions that assign
+            results = iter(value if value is not UNSET else ())
+            end = pc + 1
+            while end < len(self.blocks) and self.blocks[end] is None:
+                end += 1
+            for block_pc in range(pc, end):
+                if value is UNSET:
+                    result = UNSET
+                elif inst_operands(self.code[block_pc - 1])[0] is None:
+                    result = None
+                else:
+                    result = next(results)
+                records.append((block_pc, result))
+        return records
+
+    def dump(self, position=None, skip=0):
+        """Write the records of the ring to stderr, in the format of --trace, with the result of every instruction."""
+        code = self.code
+        records = self.records(self.position if position is None else position, skip)
+        # Only the block of an instruction that failed is known, when the program runs by block
+        failed = " (failed)" if self.blocks is None else " (in the block that failed)"
+        lines = ["qx: the last {} instructions:".format(len(records))]
+        for pc, value in records:
+            # A jump can go past the end of the program
+            line = "#{} {}".format(pc, code[pc - 1] if pc <= len(code) else "(no instruction)")
+            if value is UNSET:
+                line += failed
+            elif value is not None:
+                line += " -> " + format_result(value)
+            lines.append(line)
+        sys.stderr.write("".join(line + "\n" for line in lines))
+        sys.stderr.flush()
+
+    def dump_on_signal(self, signum, frame):
+        """A signal handler that dumps the ring, and lets the program go on."""
+        run_codes = (self.run.__func__.__code__, self.run_insts.__func__.__code__)
+        while frame is not None and frame.f_code not in run_codes:
+            frame = frame.f_back
+        # The signal can come in the middle of a record, after position, so the record there is left out
+        self.dump(frame.f_locals["position"] if frame is not None else None, skip=1)
+
+
+class LaneInterpreter(object):
+    """
+    Runs a program on many input vectors together with NumPy: every run is a lane,
+    and every variable is an array of its value in all the lanes.
+    Every step runs the instruction at the smallest pc that a lane is at, on all the lanes that are at it,
+    so the lanes that a JMPZ splits run together again once they get to the same pc.
+    Ints are int64 while they are small, and Python ints (an object array) once they may not be.
+    The outputs and the error of every lane are the ones QuadInterpreter gives on its input vector.
+    Without NumPy, or if the program is not well formed, the runs are interpreted one at a time.
+    """
+    def __init__(self, prog, vectors):
+        """vectors is a list of the input values (as strings) of every run."""
+        self.prog = prog
+        self.code = prog.code
+        self.vectors = vectors
+        # The printed values (as strings) and the error of every run
+        self.outputs = [[] for _ in vectors]
+        self.errors = [None] * len(vectors)
+
+    def run(self):
+        if numpy is None or not is_well_formed(self.code):
+            for lane, vector in enumerate(self.vectors):
+                self.run_one(lane, vector)
+            return
+
+        # Overflows make inf and nan silently, like Python floats do, and divisions by zero fail before they run
+        with numpy.errstate(all="ignore"):
+            self.run_lanes()
+
+    def run_lanes(self):
+        count = len(self.vectors)
+        self.inputs = [iter(vector) for vector in self.vectors]
+        # name -> the values of the lanes, the lanes that assigned it, and for ints, the lanes that hold a bool
+        self.values = {}
+        self.assigned = {}
+        self.bools = {}
+        self.pcs = numpy.ones(count, dtype=numpy.int64)
+        self.live = numpy.ones(count, dtype=bool)
+
+        code = self.code
+        while True:
+            live_pcs = self.pcs[self.live]
+            if not len(live_pcs):
+                break
+            pc = int(live_pcs.min())
+            # pc 0 runs the last instruction, like in QuadInterpreter
+            self.step(code[pc - 1], pc, numpy.flatnonzero(self.live & (self.pcs == pc)))
+
+    def run_one(self, lane, vector):
+        output = RunOutput()
+        try:
+            QuadInterpreter(self.prog, inputs=iter(vector), output=output).run()
+        except Exception as e:
+            self.errors[lane] = e
+        self.outputs[lane] = output.lines
+
+    def fail(self, lanes, errors):
+        for lane, error in zip(lanes, errors):
+            self.errors[lane] = error
+            self.live[lane] = False
+
+    def step(self, inst, pc, lanes):
+        op, name = inst.op, inst.op[1:]
+        dest, dest_type, sources = inst_operands(inst)
+
+        if op == "HALT":
+            self.live[lanes] = False
+            return
+        elif op == "JUMP":
+            self.pcs[lanes] = sources[0][0]
+            return
+        elif op == "JMPZ":
+            sources = sources[1:]
+
+        lanes, args = self.read(sources, lanes)
+        if not len(lanes):
+            return
+        elif op == "JMPZ":
+            self.pcs[lanes] = numpy.where(args[0] == 0, inst.opers[0], pc + 1)
+            return
+        self.pcs[lanes] = pc + 1
+        bools = False
+
+        if name == "PRT":
+            oper, type_ = sources[0]
+            if type_ is int and isinstance(oper, str):
+                bools = self.bools[oper][lanes]
+            else:
+                bools = numpy.zeros(len(lanes), dtype=bool)
+            # An int over the digit limit of the conversion to a string fails its lane
+            lanes, lines = self.replay(lambda value, is_bool: str(bool(value) if is_bool else type_(value)),
+                                       lanes, args[0], bools)
+            for lane, line in zip(lanes, lines):
+                self.outputs[lane].append(line)
+            return
+        elif name == "INP":
+            lanes, result = self.read_inputs(inst.lineno, dest_type, dest, lanes)
+        elif op == "ITOR":
+            lanes, result = self.convert(float, lanes, args[0])
+        elif op == "RTOI":
+            lanes, result = self.convert(int, lanes, args[0])
+        elif name == "ASN":
+            result = args[0]
+            oper = sources[0][0]
+            if dest_type is int and isinstance(oper, str):
+                bools = self.bools[oper][lanes]
+        else:
+            lanes, result = self.compute(name, sources[0][1], lanes, args[0], args[1])
+            if name in COMPARISON_OPS:
+                result = result.astype(numpy.int64)
+                bools = True
+
+        self.write(dest, dest_type, lanes, result, bools)
+
+    def read(self, sources, lanes):
+        """
+        The values of the sources in lanes. The lanes that read an unassigned variable fail with a KeyError,
+        like QuadInterpreter, and the lanes that are left are returned with the values.
+        """
+        for oper, _ in sources:
+            if isinstance(oper, str):
+                assigned = self.assigned.get(oper)
+                ok = assigned[lanes] if assigned is not None else numpy.zeros(len(lanes), dtype=bool)
+                if not ok.all():
+                    failed = lanes[~ok]
+                    self.fail(failed, [KeyError(oper)] * len(failed))
+                    lanes = lanes[ok]
+
+        if not len(lanes):
+            return lanes, None
+        args = []
+        for oper, type_ in sources:
+            if isinstance(oper, str):
+                args.append(self.values[oper][lanes])
+            else:
+                args.append(numpy.full(len(lanes), oper, dtype=self.lane_dtype(type_, [oper])))
+        return lanes, args
+
+    @staticmethod
+    def lane_dtype(type_, values):
+        if type_ is float:
+            return numpy.float64
+        if all(-LANE_INT_LIMIT < value < LANE_INT_LIMIT for value in values):
+            return numpy.int64
+        return object
+
+    def write(self, dest, dest_type, lanes, values, bools):
+        array = self.values.get(dest)
+        if array is None:
+            count = len(self.vectors)
+            array = self.values[dest] = numpy.zeros(count, dtype=self.lane_dtype(dest_type, []))
+            self.assigned[dest] = numpy.zeros(count, dtype=bool)
+            if dest_type is int:
+                self.bools[dest] = numpy.zeros(count, dtype=bool)
+        if values.dtype == object and array.dtype != object:
+            array = self.values[dest] = array.astype(object)
+        elif array.dtype == object and values.dtype != object:
+            # Python ints, so they do not overflow later
+            values = values.astype(object)
+
+        array[lanes] = values
+        self.assigned[dest][lanes] = True
+        if dest_type is int:
+            self.bools[dest][lanes] = bools
+
+    def read_inputs(self, lineno, type_, name, lanes):
+        values = []
+        ok = numpy.ones(len(lanes), dtype=bool)
+        for i, lane in enumerate(lanes):
+            try:
+                values.append(next_input(self.inputs[lane], lineno, type_, name))
+            except QuadError as e:
+                self.fail([lane], [e])
+                ok[i] = False
+        return lanes[ok], numpy.array(values, dtype=self.lane_dtype(type_, values))
+
+    def replay(self, operation, lanes, *args):
+        """
+        Run operation on the values of every lane in Python, to fail the lanes with the errors it raises.
+        Returns the lanes that did not fail and their results.
+        """
+        results = []
+        ok = numpy.ones(len(lanes), dtype=bool)
+        for i, values in enumerate(zip(*args)):
+            try:
+                results.append(operation(*[value.item() if isinstance(value, numpy.generic) else value
+                                           for value in values]))
+            except Exception as e:
+                self.fail([lanes[i]], [e])
+                ok[i] = False
+        return lanes[ok], results
+
+    def convert(self, type_, lanes, values):
+        if type_ is float:
+            if values.dtype != object:
+                return lanes, values.astype(numpy.float64)
+            # A Python int may be too big for a float
+            lanes, results = self.replay(float, lanes, values)
+            return lanes, numpy.array(results, dtype=numpy.float64)
+
+        bad = ~numpy.isfinite(values) | (values >= LANE_INT_LIMIT) | (values <= -LANE_INT_LIMIT)
+        if not bad.any():
+            # Truncates toward zero, like int()
+            return lanes, values.astype(numpy.int64)
+        # Fails on inf and nan, and makes big Python ints
+        lanes, results = self.replay(int, lanes, values)
+        return lanes, numpy.array(results, dtype=self.lane_dtype(int, results))
+
+    def compute(self, name, type_, lanes, a, b):
+        if name == "DIV":
+            operation = operator.floordiv if type_ is int else operator.truediv
+            zero = b == 0
+            if zero.any():
+                # Fails them with the error of a division by zero
+                self.replay(operation, lanes[zero], a[zero], b[zero])
+                lanes, a, b = lanes[~zero], a[~zero], b[~zero]
+        else:
+            operation = BINARY_OPERATIONS[name]
+
+        if type_ is int and name not in COMPARISON_OPS:
+            if a.dtype == object or b.dtype == object:
+                exact = True
+            elif name == "MLT":
+                exact = (numpy.abs(a.astype(numpy.float64) * b.astype(numpy.float64)) >= LANE_INT_LIMIT).any()
+            else:
+                exact = ((a >= LANE_INT_LIMIT) | (a <= -LANE_INT_LIMIT) |
+                         (b >= LANE_INT_LIMIT) | (b <= -LANE_INT_LIMIT)).any()
+            if exact:
+                a, b = a.astype(object), b.astype(object)
+
+        return lanes, operation(a, b)
+
+
+# The program of a pool worker process, set once when it starts by init_pool_worker
+pool_program = None
+
+
+def init_pool_worker(program):
+    global pool_program
+    pool_program = program
+
+
+def run_pool_vector(vector):
+    """
+    Run the program of the pool worker on the input vector.
+    Returns the printed values (as strings) and the error of the run, a QuadError (with no line if it has none), or None.
+    """
+    output = RunOutput()
+    interpreter = BlockInterpreter(pool_program, inputs=iter(vector), output=output)
+    try:
+        interpreter.run()
+    except QuadError as e:
+        return output.lines, e
+    except Exception as e:
+        lineno = interpreter.failed_lineno(sys.exc_info()[2])
+        return output.lines, QuadError(lineno, "{}: {}".format(type(e).__name__, e))
+    return output.lines, None
+
+
+def run_pool(program, vectors, jobs=None, chunk_size=POOL_CHUNK_SIZE):
+    """
+    Run program on every input vector in a pool of jobs worker processes (None for one per CPU),
+    which get chunk_size vectors at a time. The program is sent to every worker once, when it starts.
+    Yields the printed values and the error of every run (as run_pool_vector returns them), in the order of vectors.
+    """
+    pool = multiprocessing.Pool(jobs, initializer=init_pool_worker, initargs=(program,))
+    try:
+        for result in pool.imap(run_pool_vector, vectors, chunk_size):
+            yield result
+        pool.close()
+    finally:
+        # Only still running if the results were not all taken
+        pool.terminate()
+        pool.join()
+
+
+def lane_runs(program, vectors, lanes):
+    """Run program on every input vector, lanes of them at a time, and yield the outputs and the error of every run."""
+    for start in range(0, len(vectors), lanes):
+        interpreter = LaneInterpreter(program, vectors[start:start + lanes])
+        interpreter.run()
+        for output, error in zip(interpreter.outputs, interpreter.errors):
+            yield output, error
+
+
+def run_vectors(program, vectors, lanes, source, jobs=None, chunk_size=POOL_CHUNK_SIZE):
+    """
+    Run program on every input vector and print the output of every run on a line.
+    The runs are run by a pool of jobs processes (0 for one per CPU), or in this process
+    lanes of them at a time if jobs is None.
+    Returns whether all the runs finished.
+    """
+    if jobs is None:
+        runs = lane_runs(program, vectors, lanes)
+    else:
+        runs = run_pool(program, vectors, jobs or None, chunk_size)
+
+    ok = True
+    for run, (output, error) in enumerate(runs, 1):
+        sys.stdout.write(" ".join(output) + "\n")
+        if error is None:
+            continue
+        ok = False
+        if not isinstance(error, QuadError):
+            print("{}: error: {}: {} (run {})".format(source, type(error).__name__, error, run), file=sys.stderr)
+        elif error.lineno is None:
+            print("{}: error: {} (run {})".format(source, error.msg, run), file=sys.stderr)
+        else:
+            print("{}:{}: error: {} (run {})".format(source, error.lineno, error.msg, run), file=sys.stderr)
+    sys.stdout.flush()
+    return ok
+
+
 def main():
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("source")
     parser.add_argument("-t", "--trace", action="store_true",
                         help="enable tracing")
+    parser.add_argument("-b", "--batch", action="store_true",
+                        help="read the input values from stdin without prompts, and buffer the output")
+    parser.add_argument("-i", "--input", metavar="FILE",
+                        help="read the input values from FILE (implies --batch)")
+    parser.add_argument("--vectors", metavar="FILE",
+                        help="run the program once for every line of FILE, which holds the input values of the run, "
+                             "many runs together (with NumPy), and print the output of every run on a line")
+    parser.add_argument("--lanes", type=int, default=LANE_COUNT, metavar="N",
+                        help="the number of runs of --vectors that run together (default: {})".format(LANE_COUNT))
+    parser.add_argument("-j", "--jobs", type=int, metavar="N",
+                        help="run the runs of --vectors in a pool of N processes, one per CPU if N is 0 "
+                             "(default: run them in this process)")
+    parser.add_argument("--chunk-size", type=int, default=POOL_CHUNK_SIZE, metavar="N",
+                        help="the number of runs that a process of --jobs gets at a time "
+                             "(default: {})".format(POOL_CHUNK_SIZE))
+    parser.add_argument("-p", "--profile", metavar="FILE",
+                        help="count how many times every instruction runs and every JMPZ is taken, and when the "
+                             "program ends write a report of the hottest loops and instructions to FILE (- for stderr)")
+    parser.add_argument("--profile-format", choices=("text", "json"), default="text",
+                        help="the format of the --profile report (default: text)")
+    parser.add_argument("--profile-sample", type=int, default=0, metavar="N",
+                        help="also time one in N of the instructions that run for --profile, at random (default: 0, no timing)")
+    parser.add_argument("-r", "--ring", type=int, metavar="N",
+                        help="record the last N blocks that ran with the results of their instructions (rounded up "
+                             "to a power of 2), and write them to stderr when the program fails or gets SIGUSR1")
 
     args = parser.parse_args()
+    if args.vectors is not None and (args.trace or args.batch or args.input is not None):
+        parser.error("--vectors can not be used with --trace, --batch or --input")
+    if args.lanes < 1:
+        parser.error("--lanes must be positive")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be positive")
+    if args.jobs is not None and (args.vectors is None or args.jobs < 0):
+        parser.error("--jobs needs --vectors, and can not be negative")
+    if args.profile is not None and (args.trace or args.vectors is not None):
+        parser.error("--profile can not be used with --trace or --vectors")
+    if args.profile_sample < 0:
+        parser.error("--profile-sample can not be negative")
+    if args.ring is not None and (args.trace or args.vectors is not None or args.profile is not None):
+        parser.error("--ring can not be used with --trace, --vectors or --profile")
+    if args.ring is not None and args.ring < 1:
+        parser.error("--ring must be positive")
 
     try:
-        with open(args.source, "r") as f:
-            program = QuadProgram(f)
+        program = load_program(args.source)
+
+        if args.vectors is not None:
+            with open(args.vectors) as f:
+                vectors = [line.split() for line in f]
+            return 0 if run_vectors(program, vectors, args.lanes, args.source, args.jobs, args.chunk_size) else 1
+
+        inputs = output = None
+        if args.batch or args.input is not None:
+            inputs = read_tokens(args.input)
+            output = BatchOutput(sys.stdout)
+
+        if args.profile is not None:
+            interpreter = ProfilingInterpreter(
+                program, inputs=inputs, output=output, sample_every=args.profile_sample)
+        elif args.ring is not None:
+            interpreter = RingTraceInterpreter(program, args.ring, inputs=inputs, output=output)
+            # Not on Windows
+            if hasattr(signal, "SIGUSR1"):
+                signal.signal(signal.SIGUSR1, interpreter.dump_on_signal)
+        elif args.trace:
+            # Runs one instruction at a time, so it can trace them
+            interpreter = QuadInterpreter(program, trace=True, inputs=inputs, output=output)
+        else:
+            interpreter = BlockInterpreter(program, inputs=inputs, output=output)
 
-        interpreter = QuadInterpreter(program, trace=args.trace)
-        interpreter.run()
+        try:
+            interpreter.run()
+        finally:
+            # Flushed at HALT, and before an error is reported
+            if output is not None:
+                output.flush()
+            # Also when the program fails, the report shows how it got there
+            if args.profile is not None:
+                write_profile(interpreter.profile(), args.profile, args.profile_format)
     except QuadError as e:
         print("{}:{}: error: {}".format(args.source, e.lineno, e.msg), file=sys.stderr)
         return 1